@@ -4,11 +4,14 @@ import threading
 from concurrent.futures import Future
 import re
 from pathlib import Path
-from typing import Dict, List, Optional, Pattern, Tuple
+from typing import Dict, List, Optional, Pattern, Tuple, TYPE_CHECKING
 
 from halo_mcp.mcp_call import MCPClient
-from halo_playwright.playwright_mixi2 import MixiClient
-from bluetooth.bluetooth_controll import CarController
+
+# playwright / bleak は読み込みが重いので、使う時まで import しない
+if TYPE_CHECKING:
+    from halo_playwright.playwright_mixi2 import MixiClient
+    from bluetooth.bluetooth_controll import CarController
 
 
 
@@ -20,7 +23,7 @@ class CommandSelector:
     """
 
     def __init__(self, config_path: str = "command.json", general_config: dict = {}) -> None:
-        self.mixi_client = MixiClient(headless=True)
+        self._mixi_client: Optional["MixiClient"] = None
         self.config_path: str = config_path
         self.general_config: dict = general_config
         self.use_bluetooth: bool = self.general_config["bluetooth"]["use_bluetooth"]
@@ -29,14 +32,25 @@ class CommandSelector:
         self.listRules: List[Tuple[str, Pattern[str]]] = []
         self._load_config()
         self.mcp_client = MCPClient()
-        self.car_controller = CarController(
-            self.bluetooth_address, 
-            self.bluetooth_char_uuid
-        )
+        self.car_controller: Optional["CarController"] = None
+        if self.use_bluetooth:
+            from bluetooth.bluetooth_controll import CarController
+            self.car_controller = CarController(
+                self.bluetooth_address, 
+                self.bluetooth_char_uuid
+            )
         self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
         self._loop_thread = None  # type: Optional[threading.Thread]
         self._car_connected: bool = False
 
+    @property
+    def mixi_client(self) -> "MixiClient":
+        """SNS投稿コマンドが初めて来た時に playwright を読み込んで生成する"""
+        if self._mixi_client is None:
+            from halo_playwright.playwright_mixi2 import MixiClient
+            self._mixi_client = MixiClient(headless=True)
+        return self._mixi_client
+
     def _ensure_loop(self) -> None:
         if not self.use_bluetooth:
             return
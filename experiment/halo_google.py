@@ -1,6 +1,8 @@
 import json
 import threading
 import time
+from collections import deque
+from concurrent.futures import Future, wait
 from typing import Optional, TYPE_CHECKING
 
 from stt_google import GoogleSpeechToText
@@ -9,13 +11,14 @@ from corr_gate import CorrelationGate
 from llm import LLM
 from command_selector import CommandSelector
 from halo_helper import HaloHelper
+from tts_worker import TTSWorkerMixin
 
 if TYPE_CHECKING:
     from function_led import LEDBlinker
     from function_motor import Motor
 
 
-class HaloStreamingGoogle:
+class HaloStreamingGoogle(TTSWorkerMixin):
     def __init__(self, config_path: str = "config.json") -> None:
         self.halo_helper = HaloHelper()
         self.cfg = self.halo_helper.load_config(config_path)
@@ -82,12 +85,17 @@ class HaloStreamingGoogle:
         except Exception:
             pass
         self.llm = LLM()
-        self.history: str = ""
+        self.history_turns: deque[tuple[str, str]] = deque()
+        # 応答の履歴追加はTTSスレッドから行うので、メインループの追加・描画と排他する
+        self.history_lock = threading.Lock()
+        # 履歴の上限は config.json に合わせる（追加のたびに古い発話から落とす）
+        self.history_max_turns: int = int(self.cfg.get("history_max_turns", 16))
+        self.history_max_tokens: int = int(self.cfg.get("history_max_tokens", 2000))
         self.system_content = self.halo_helper.load_system_prompt_and_replace(self.owner_name, self.your_name)
         self.command_selector = CommandSelector()
 
         # TTSをバックグラウンドで回すためのスレッド管理
-        self.tts_thread: Optional[threading.Thread] = None
+        self.tts_fut: Optional[Future] = None
         self.tts_lock = threading.Lock()
         # STT安定化用カウンタ
         self._stt_fail_count: int = 0
@@ -100,35 +108,32 @@ class HaloStreamingGoogle:
         try:
             while True:
                 print("[STT] 開始")
-                had_any_result = False
-                did_barge_in_stop = False
                 try:
-                    transcript = self.stt.listen_once(timeout_sec=12.0, rpc_timeout_sec=45.0)
+                    transcript = self.stt.listen_once_fast(timeout_sec=12.0, rpc_timeout_sec=45.0)
                     if transcript:
-                        had_any_result = True
                         self._stt_fail_count = 0
                     else:
+                        # 待ち時間は STT 自身のタイムアウトで済んでいるので、すぐ次のストリームを開く
                         print("[STT] 結果なし（タイムアウト/無音）")
                         self._stt_fail_count += 1
-                        time.sleep(0.1)
                         continue
 
                     print(f"\n確定: {transcript}")
                     # 置換（名前など）
                     user_text = self.halo_helper.apply_text_changes(transcript, self.change_text_map)
                     # 履歴にユーザー発話を追加
-                    self.history = self.halo_helper.append_history(self.history, self.owner_name, user_text)
-                    # LLMで応答
+                    with self.history_lock:
+                        self.halo_helper.append_history_turn(self.history_turns, self.owner_name, user_text, self.history_max_tokens, self.history_max_turns)
+                        history = self.halo_helper.render_history(self.history_turns)
+                    # LLMで応答（断片を受け取りながら文ごとに合成・再生する）
                     try:
                         print("LLMで応答を生成中...")
-                        response_text = self.llm.generate_text(self.llm_model, user_text, self.system_content, self.history)
+                        llm_stream = self.llm.stream_generate_text(self.llm_model, user_text, self.system_content, history)
                     except Exception as e:
                         print(f"LLMエラー: {e}")
                         continue
-                    response = self.halo_helper.replace_dont_need_word(response_text, self.your_name)
-                    self.history = self.halo_helper.append_history(self.history, self.your_name, response)
                     # 新規確定が来たら現TTSを停止し、最新のみ再生
-                    self.speak_async(response)
+                    self.speak_stream_async(llm_stream)
                     #self._reset_stt()
 
                 except KeyboardInterrupt:
@@ -141,19 +146,15 @@ class HaloStreamingGoogle:
                         print("[STT] エラーが続いたためクライアントを再生成します")
                         self._reset_stt()
                 finally:
+                    # ここで continue すると上の break（Ctrl+C）が打ち消されるので、ログだけにする
                     print("[STT] ストリーム終了")
-                    # 何も結果が得られずに終了した場合、短い待機を挟んで再試行
-                    if not had_any_result:
-                        time.sleep(0.3)
-                    # single_utterance=False でも外側ループで回し直す
-                    continue
         except KeyboardInterrupt:
             print("\n終了します...")
         finally:
             try:
                 self.stop_tts()
-                if self.tts_thread and self.tts_thread.is_alive():
-                    self.tts_thread.join(timeout=0.5)
+                if self.tts_fut is not None:
+                    wait([self.tts_fut], timeout=0.5)
             except Exception:
                 pass
             try:
@@ -167,46 +168,6 @@ class HaloStreamingGoogle:
             except Exception:
                 pass
 
-    # ---------- tts control ----------
-    def stop_tts(self) -> None:
-        try:
-            self.tts.stop()
-        except Exception:
-            pass
-
-    def speak_async(self, text: str) -> None:
-        # 進行中があれば停止
-        with self.tts_lock:
-            self.stop_tts()
-            # 再生停止の完了を待つ（短時間）
-            try:
-                # まずはスレッドの終了を待機
-                if self.tts_thread and self.tts_thread.is_alive():
-                    self.tts_thread.join(timeout=1.0)
-            except Exception as e:
-                print(f"TTSスレッド終了エラー: {e}")
-            # それでも再生が残っている場合はポーリングで確認
-            try:
-                deadline = time.time() + 3.0
-                while (
-                    (self.tts_thread and self.tts_thread.is_alive())
-                    or self.tts.is_playing()
-                ) and time.time() < deadline:
-                    time.sleep(0.02)
-                if self.tts_thread and not self.tts_thread.is_alive():
-                    self.tts_thread = None
-            except Exception:
-                pass
-            
-            def _run():
-                try:
-                    self.tts.speak(text, self.led, self.use_led, self.motor, self.use_motor, corr_gate=self.corr_gate)
-                except Exception as e:
-                    print(f"TTSエラー: {e}")
-
-            self.tts_thread = threading.Thread(target=_run, daemon=True)
-            self.tts_thread.start()
-
     def _reset_stt(self) -> None:
         try:
             self.stt.close()
@@ -1,9 +1,11 @@
 # halo.py
 import json
+import re
 import threading
 import time
-import re
-import queue
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import suppress
 from typing import Optional, TYPE_CHECKING, Union
 from similarity import TextSimilarity
 
@@ -16,13 +18,20 @@ from command_selector import CommandSelector
 from corr_gate import CorrelationGate
 from asr_coherence import ASRCoherenceFilter
 from vad import VAD
-from halo_helper import HaloHelper
+from halo_helper import HaloHelper, compile_keyword_matcher
 
 if TYPE_CHECKING:
     from function_led import LEDBlinker
     from function_motor import Motor
 
 
+_SUPPRESS = suppress(Exception)
+
+# 終了コマンドとみなす語
+_FAREWELL_TOKENS = ("終了", "バイバイ", "さようなら")
+_FAREWELL_RE = re.compile("|".join(map(re.escape, _FAREWELL_TOKENS)))
+
+
 class HaloApp:
     def __init__(self) -> None:
         self.halo_helper = HaloHelper()
@@ -41,11 +50,13 @@ class HaloApp:
         self.pan_pin: int = self.config["motor"]["pan_pin"]
         self.tilt_pin: int = self.config["motor"]["tilt_pin"]
         self.interrupt_word: str = self.config["interrupt_word"]
-        self.interrupt_word_pattern = re.compile(self.interrupt_word)
+        self.is_interrupt_word = compile_keyword_matcher(self.interrupt_word)
         self.wakeup_word: str = self.config["wakeup_word"]
-        self.wakeup_word_pattern = re.compile(self.wakeup_word)
+        self.is_wakeup_word = compile_keyword_matcher(self.wakeup_word)
         self.similarity_threshold: float = self.config["similarity_threshold"]
         self.coherence_threshold: float = self.config["coherence_threshold"]
+        # 会話セッションのタイムアウト（秒）。設定があれば使用、なければ120秒。
+        self.run_timeout_sec: float = float(self.config.get("run_timeout_sec", 120))
         self.command_selector = CommandSelector()
         self.llm = LLM()
         self.stt = self.load_stt(self.stt_type)
@@ -120,11 +131,19 @@ class HaloApp:
             print(f"STT warm_up でエラー: {e}")
 
         # 常時STT運用用の状態
-        self.history: str = ""
+        # 履歴は (名前, 発話) のリストで持ち、LLMに渡す時だけ文字列にする
+        self.history_turns: deque[tuple[str, str]] = deque()
         self.is_running: bool = True
-        self.recognized_queue: "queue.Queue[str]" = queue.Queue()
+        # 終了通知（sleepでのポーリングをやめ、Eventで待つ）
+        self._stop_event = threading.Event()
+        # 確定テキストは「最新のものだけ」処理するので、キューではなく1枠のスロットで受け渡す
+        self._latest_text: Optional[str] = None
+        self._latest_lock = threading.Lock()
+        self._latest_evt = threading.Event()
         self.processor_thread: Optional[threading.Thread] = None
         self.similarity = TextSimilarity()
+        # 確定テキストの類似度/破綻チェックを並行に回すためのプール
+        self._gate_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="halo_gate")
 
     # ----------------- メインループ -----------------
     def main_loop(self) -> None:
@@ -146,7 +165,7 @@ class HaloApp:
                 time.sleep(0.1)
                 continue
             first_text = self.first_stt()
-            if not self.wakeup_word_pattern.match(first_text):
+            if not self.is_wakeup_word(first_text):
                 print("keyword not in user_text")
                 time.sleep(0.1)
                 continue
@@ -179,10 +198,11 @@ class HaloApp:
         print("=== 常時STTモードを開始します（Ctrl+Cで終了）===")
         # 2周目以降では前回終了時に False になっているため、毎回リセット
         self.is_running = True
+        self._stop_event.clear()
+        self.take_latest_text()
         # デバイスが前回の終了で解放済みなら再初期化
         self._ensure_devices_ready()
-        # タイムアウト（秒）。設定があれば使用、なければ120秒。
-        run_timeout_sec = float(self.config.get("run_timeout_sec", 120))
+        run_timeout_sec = self.run_timeout_sec
         self.run_deadline = time.perf_counter() + run_timeout_sec
 
         recognizing_cb = None
@@ -193,46 +213,43 @@ class HaloApp:
         rec = None
         self.response = ""
 
-        def _clear_queue(q: "queue.Queue[str]") -> None:
-            try:
-                while True:
-                    q.get_nowait()
-            except Exception:
-                pass
-
         def _processor_loop():
             while self.is_running:
-                try:
-                    text = self.recognized_queue.get(timeout=0.1)
-                except queue.Empty:
-                    continue
+                # stop_running() がイベントを立てて起こすので、タイムアウトなしで待つ
+                self._latest_evt.wait()
+                text = self.take_latest_text()
+                if text is None or not self.is_running:
+                    break
                 try:
                     user_text = self.halo_helper.apply_text_changes(text, self.change_name)
-                    self.history = self.halo_helper.append_history(self.history, self.owner_name, user_text)
+                    self.halo_helper.append_history_turn(self.history_turns, self.owner_name, user_text)
 
                     if self.check_farewell(user_text):
                         break
 
                     print("LLMで応答を生成中...")
-                    response_text = self.llm.generate_text(self.llm_model, user_text, self.system_content, self.history)
-                    self.response, self.command = self.halo_helper.get_halo_response(response_text)
+                    # 生成を待たず、文ができ次第読み上げる（割り込みで self.tts.stop() される想定）
+                    parts: list[str] = []
+                    llm_stream = self.llm.stream_generate_text(self.llm_model, user_text, self.system_content, self.halo_helper.render_history(self.history_turns))
+                    try:
+                        self.tts.stream_speak(self.halo_helper.iter_message_tokens(llm_stream, parts), None, corr_gate=self.corr_gate)
+                    finally:
+                        llm_stream.close()
+                    self.response, self.command = self.halo_helper.get_halo_response("".join(parts))
+                    print(f"応答: {self.response}")
                     # コマンドがあれば実行
                     if self.command != {}:
                         self.command_selector.exec_command(self.command["key"], self.command["value"])
-                    self.history = self.halo_helper.append_history(self.history, self.your_name, self.response)
-
-                    print(f"応答: {self.response}")
-                    # 応答読み上げ（割り込みで self.tts.stop() される想定）
-                    self.tts.speak(self.response, self.led, self.use_led, self.motor, self.use_motor, corr_gate=self.corr_gate)
+                    self.halo_helper.append_history_turn(self.history_turns, self.your_name, self.response)
 
                     # タイムアウト時間を更新
-                    self.run_deadline = time.perf_counter() + float(self.config.get("run_timeout_sec", 120))
+                    self.run_deadline = time.perf_counter() + run_timeout_sec
                     print(f"タイムアウト時間: {self.run_deadline}")
 
                 except KeyboardInterrupt:
-                    with self._suppress_ex():
+                    with _SUPPRESS:
                         self.tts.stop()
-                    self.is_running = False
+                    self.stop_running()
                     break
                 except Exception as e:
                     print(f"LLM/TTSでエラーが発生しました: {e}")
@@ -240,42 +257,48 @@ class HaloApp:
         try:
             # 認識イベントの登録（Azureの連続認識がある場合）
             if hasattr(self.stt, "recognizer"):
+                # コールバックは 10-30Hz で呼ばれるため、参照先は登録時に一度だけ束縛する
+                _check_warikomi = self.check_warikomi
+                _should_drop = self.should_drop_text
+                _tts_stop = self.tts.stop
+                _stop_led = self.stop_led
+                _stop_motor = self.stop_motor
+                _say_filler = self.say_filler
+                _publish = self.publish_latest_text
+
                 #音声認識中のイベントハンドラ
                 def on_recognizing(evt):
                     try:
-                        txt = getattr(evt.result, "text", "") or ""
-                        if txt:
-                            print(f"中間: {txt}")
-                            check_warikomi(txt)    # 割り込みチェック
-                        
-                    except Exception:
-                        pass
-                
+                        txt = evt.result.text
+                    except AttributeError:
+                        return
+                    if txt:
+                        print(f"中間: {txt}")
+                        _check_warikomi(txt)    # 割り込みチェック
+
                 #音声認識確定時のイベントハンドラ
                 def on_recognized(evt):
                     try:
-                        txt = getattr(evt.result, "text", "") or ""
-                        if not txt:
-                            return
-                        print(f"確定: {txt}")
-                        self.is_warikomi = False
-
-                        # ハロが言った話と似ているか(true : 似てる)
-                        if is_similarity_threshold(txt, self.response):
-                            return
-                        # 文章が破綻していないか(true : 破綻)
-                        if is_coherence_threshold(txt, self.coherence_threshold):
-                            return
-                        # 新規の確定が来たら現在のTTSを停止し、最新のもののみ処理
-                        with self._suppress_ex():
-                            self.tts.stop()
-                        stop_led(); stop_motor()
-                        # フィラー再生（確定直後に再生開始）
-                        self.say_filler(txt)
-                        _clear_queue(self.recognized_queue)
-                        self.recognized_queue.put(txt)
-                    except Exception:
-                        pass
+                        txt = evt.result.text
+                    except AttributeError:
+                        return
+                    if not txt:
+                        return
+                    print(f"確定: {txt}")
+                    self.is_warikomi = False
+
+                    # ハロが言った話と似ている / 文章が破綻している場合は無視
+                    if _should_drop(txt):
+                        return
+                    # 新規の確定が来たら現在のTTSを停止し、最新のもののみ処理
+                    with _SUPPRESS:
+                        _tts_stop()
+                    _stop_led(); _stop_motor()
+                    # フィラー再生（確定直後に再生開始）
+                    with _SUPPRESS:
+                        _say_filler(txt)
+                    _publish(txt)
+
                 def on_canceled(evt):
                     try:
                         reason = getattr(evt, "reason", None)
@@ -296,53 +319,6 @@ class HaloApp:
                     print("=== 連続認識開始 ===")
                 def on_session_stopped(evt):
                     print("=== 連続認識終了 ===")
-                    
-                # 割り込みのチェック
-                def check_warikomi(txt: str):
-                    if self.interrupt_word_pattern.match(txt) and self.tts.is_playing() and not self.is_warikomi:
-                        self.is_warikomi = True
-                        print(f"tts中間結果に『{self.interrupt_word}』を検出")
-                        with self._suppress_ex():
-                            self.tts.stop()
-                        stop_motor()
-                        if getattr(self, "warikomi_player", None):
-                            try:
-                                self.warikomi_player.random_play(block=False)
-                                print("割り込み時のボイス再生中")
-                            except Exception:
-                                pass
-                
-                # 確定テキストが前回のハロの発言と似ていた場合ループバックと捉え無視
-                def is_similarity_threshold(txt: str, response: str) -> bool:
-                    if self.is_similarity_threshold(txt, response):
-                        print(f"類似度がしきい値を超えています :txt: {txt} :response: {response}")
-                        return True
-                    return False
-                def is_coherence_threshold(txt: str, threshold: float) -> bool:
-                    is_noisy, score = self.asr_coherence_filter.is_noisy(txt, threshold)
-                    # 完全に0の時は文中にハテナがあるなど
-                    if score == 0.0:
-                        is_noisy = False
-                    if is_noisy:
-                        print(f"破綻がしきい値を超えています :txt: {txt} :threshold: {threshold}")
-                        return True
-                    return False
-                
-                # LED停止
-                def stop_led():
-                    if self.use_led and self.led:
-                        with self._suppress_ex():
-                            self.led.stop_blink()
-                    return
-                # モーター停止
-                def stop_motor():
-                    if self.use_motor and self.motor:
-                        with self._suppress_ex():
-                            try:
-                                self.motor.stop_motion()
-                            except Exception:
-                                pass
-                    
 
                 rec = self.stt.recognizer
                 recognizing_cb = rec.recognizing.connect(on_recognizing)
@@ -353,7 +329,7 @@ class HaloApp:
 
                 # 接続開始 → 連続認識開始
                 if hasattr(self.stt, "connection") and self.stt.connection is not None:
-                    with self._suppress_ex():
+                    with _SUPPRESS:
                         self.stt.connection.open(True)
                 rec.start_continuous_recognition_async().get()
             else:
@@ -368,33 +344,36 @@ class HaloApp:
                                 break
                             if text:
                                 print(f"確定: {text}")
-                                with self._suppress_ex():
+                                with _SUPPRESS:
                                     self.tts.stop()
                                 print("LLMで応答を生成中...")
-                                response_text = self.llm.generate_text(self.llm_model, text, self.system_content, self.history)
-                                self.response, self.command = self.halo_helper.get_halo_response(response_text)
-                                self.history = self.halo_helper.append_history(self.history, self.your_name, self.response)
-                                # 応答読み上げ（割り込みで self.tts.stop() される想定）
-                                self.tts.speak(self.response, self.led, self.use_led, self.motor, self.use_motor, corr_gate=self.corr_gate)
+                                # 全文を待たずに文ができ次第読み上げる（割り込みで self.tts.stop() される想定）
+                                parts: list[str] = []
+                                llm_stream = self.llm.stream_generate_text(self.llm_model, text, self.system_content, self.halo_helper.render_history(self.history_turns))
+                                try:
+                                    self.tts.stream_speak(self.halo_helper.iter_message_tokens(llm_stream, parts), None, corr_gate=self.corr_gate)
+                                finally:
+                                    llm_stream.close()
+                                self.response, self.command = self.halo_helper.get_halo_response("".join(parts))
+                                self.halo_helper.append_history_turn(self.history_turns, self.your_name, self.response)
                         except KeyboardInterrupt:
-                            self.is_running = False
+                            self.stop_running()
                             break
                         except Exception as e:
                             print(f"STTフォールバック中にエラー: {e}")
-                            time.sleep(0.2)
+                            self._stop_event.wait(0.2)
                 threading.Thread(target=_fallback_listener, daemon=True).start()
 
             # 応答処理スレッド開始
             self.processor_thread = threading.Thread(target=_processor_loop, daemon=True)
             self.processor_thread.start()
 
-            # メインスレッドは待機（タイムアウト監視）
-            while self.is_running:
+            # メインスレッドは待機（タイムアウト監視）。応答ごとに run_deadline が延びるので、起きたら再計算する
+            while not self._stop_event.wait(timeout=max(0.0, self.run_deadline - time.perf_counter())):
                 if time.perf_counter() >= self.run_deadline:
                     print(f"タイムアウト({run_timeout_sec:.0f}s)により終了します。")
-                    self.is_running = False
+                    self.stop_running()
                     break
-                time.sleep(0.2)
 
         except KeyboardInterrupt:
             print("\n\n会話を終了します。")
@@ -403,30 +382,33 @@ class HaloApp:
             import traceback
             traceback.print_exc()
         finally:
-            self.is_running = False
-            with self._suppress_ex():
+            self.stop_running()
+            with _SUPPRESS:
                 if self.processor_thread is not None:
                     self.processor_thread.join(timeout=1.0)
             # 認識停止とハンドラ解除
-            with self._suppress_ex():
+            with _SUPPRESS:
                 if hasattr(self.stt, "recognizer") and rec is not None:
                     try:
                         rec.stop_continuous_recognition_async().get()
                     except Exception:
                         pass
-                    try:
-                        rec.recognizing.disconnect(recognizing_cb) if recognizing_cb else None
-                        rec.recognized.disconnect(recognized_cb) if recognized_cb else None
-                        rec.canceled.disconnect(canceled_cb) if canceled_cb else None
-                        rec.session_started.disconnect(session_started_cb) if session_started_cb else None
-                        rec.session_stopped.disconnect(session_stopped_cb) if session_stopped_cb else None
-                    except Exception:
-                        pass
-            with self._suppress_ex():
+                    # 1つの解除に失敗しても残りは解除する
+                    for sig, cb in (
+                        (rec.recognizing, recognizing_cb),
+                        (rec.recognized, recognized_cb),
+                        (rec.canceled, canceled_cb),
+                        (rec.session_started, session_started_cb),
+                        (rec.session_stopped, session_stopped_cb),
+                    ):
+                        if cb is not None:
+                            with _SUPPRESS:
+                                sig.disconnect(cb)
+            with _SUPPRESS:
                 self.tts.stop()
-            with self._suppress_ex():
+            with _SUPPRESS:
                 self.stt.close()
-            with self._suppress_ex():
+            with _SUPPRESS:
                 if self.use_motor and self.motor:
                     # 次回以降も継続利用するため解放せず停止のみにする
                     try:
@@ -495,14 +477,87 @@ class HaloApp:
         else:
             raise ValueError(f"Invalid STT type: {stt_type}")
 
-    @staticmethod
-    def _suppress_ex():
-        class _Ctx:
-            def __enter__(self):
-                return self
-            def __exit__(self, exc_type, exc, tb):
+    # ----------------- 認識イベント処理 -----------------
+    # 割り込みのチェック
+    def check_warikomi(self, txt: str) -> None:
+        if self.is_warikomi or not self.is_interrupt_word(txt) or not self.tts.is_playing():
+            return
+        self.is_warikomi = True
+        print(f"tts中間結果に『{self.interrupt_word}』を検出")
+        with _SUPPRESS:
+            self.tts.stop()
+        self.stop_motor()
+        if self.warikomi_player is not None:
+            with _SUPPRESS:
+                self.warikomi_player.random_play(block=False)
+                print("割り込み時のボイス再生中")
+
+    # 確定テキストが前回のハロの発言と似ていた場合ループバックと捉え無視
+    def is_loopback_text(self, txt: str) -> bool:
+        if self.is_similarity_threshold(txt, self.response):
+            print(f"類似度がしきい値を超えています :txt: {txt} :response: {self.response}")
+            return True
+        return False
+
+    # 確定テキストが破綻している場合は無視
+    def is_broken_text(self, txt: str) -> bool:
+        try:
+            is_noisy, score = self.asr_coherence_filter.is_noisy(txt, self.coherence_threshold)
+        except Exception:
+            return False
+        # 完全に0の時は文中にハテナがあるなど
+        if score == 0.0:
+            is_noisy = False
+        if is_noisy:
+            print(f"破綻がしきい値を超えています :txt: {txt} :threshold: {self.coherence_threshold}")
+            return True
+        return False
+
+    # 類似度チェックと破綻チェックを並行に実行し、どちらかが True を返した時点で破棄と判定
+    def should_drop_text(self, txt: str) -> bool:
+        pending = {
+            self._gate_pool.submit(self.is_loopback_text, txt),
+            self._gate_pool.submit(self.is_broken_text, txt),
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if any(f.result() for f in done):
+                for f in pending:
+                    f.cancel()
                 return True
-        return _Ctx()
+        return False
+
+    # LED停止
+    def stop_led(self) -> None:
+        if self.use_led and self.led:
+            with _SUPPRESS:
+                self.led.stop_blink()
+
+    # モーター停止
+    def stop_motor(self) -> None:
+        if self.use_motor and self.motor:
+            with _SUPPRESS:
+                self.motor.stop_motion()
+
+    # 実行中フラグを落とし、待機中のスレッドを起こす
+    def stop_running(self) -> None:
+        self.is_running = False
+        self._stop_event.set()
+        self._latest_evt.set()
+
+    # 確定テキストを最新値で上書きし、処理スレッドを起こす
+    def publish_latest_text(self, txt: str) -> None:
+        with self._latest_lock:
+            self._latest_text = txt
+            self._latest_evt.set()
+
+    # 最新の確定テキストを取り出してスロットを空にする（無ければ None）
+    def take_latest_text(self) -> Optional[str]:
+        with self._latest_lock:
+            txt = self._latest_text
+            self._latest_text = None
+            self._latest_evt.clear()
+        return txt
 
     # ----------------- 会話ロジック -----------------
     # 終了コマンドチェック
@@ -510,9 +565,9 @@ class HaloApp:
         if self.check_end_command(txt):
             farewell = "バイバイ！"
             print(f"{self.your_name}: {farewell}")
-            with self._suppress_ex():
+            with _SUPPRESS:
                 self.tts.speak(farewell, self.led, self.use_led, self.motor, self.use_motor, corr_gate=self.corr_gate)
-            self.is_running = False
+            self.stop_running()
             return True
         return False
 
@@ -527,7 +582,8 @@ class HaloApp:
 
     @staticmethod
     def check_end_command(user_text: str) -> bool:
-        return any(k in user_text for k in ("終了", "バイバイ", "さようなら"))
+        # 1回の走査でどれかを含むか判定
+        return _FAREWELL_RE.search(user_text) is not None
 
     def move_pan_kyoro_kyoro(self, speed: float = 1, count: int = 1):
         if self.use_motor and self.motor:
@@ -551,8 +607,13 @@ class HaloApp:
 
     def is_similarity_threshold(self, user_text: str, response: str) -> bool:
         # 類似度（ユーザ確定テキスト vs 応答テキストの一部）
+        if not self.response or not user_text:
+            return False
         score = 0.0
         try:
+            # 上限値がしきい値未満なら部分文字列の総当たりを省く
+            if self.similarity.upper_bound(user_text, self.response) < self.similarity_threshold:
+                return False
             # print(f"類似度計算 :user_text: {user_text} :response: {self.response}")
             score, best_sub = self.similarity.calc_max_substring_similarity(user_text, self.response)
             print(f"類似度: {score * 100:.1f}%  一致抜粋: {best_sub[:80]}")
@@ -17,6 +17,36 @@ if TYPE_CHECKING:
     from function_led import LEDBlinker
     from function_motor import Motor
 
+# pybase64 があればマイク音声の base64 化に SIMD 実装を使う（無ければ標準ライブラリ）
+try:
+    from pybase64 import b64encode as _b64encode
+except ImportError:
+    _b64encode = base64.b64encode
+
+# numba があればマイク入力の線形補間を JIT カーネルで行う（無ければ NumPy の事前計算版を使う）
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True, boundscheck=False)
+    def _resample_i16_kernel(pcm, out, step_q16):
+        # 参照位置を 16bit 固定小数点で進め、int16 を直接書き込む（float の中間配列を作らない）
+        n = pcm.size
+        acc = 0
+        for i in range(out.size):
+            j = acc >> 16
+            if j >= n:
+                j = n - 1
+            f = acc & 0xFFFF
+            a = np.int64(pcm[j])
+            b = np.int64(pcm[j + 1]) if j + 1 < n else a
+            out[i] = a + (((b - a) * f) >> 16)
+            acc += step_q16
+else:
+    _resample_i16_kernel = None
+
 
 # ===== OpenAI Realtime 接続設定 =====
 API_KEY = os.environ.get("OPENAI_API_KEY")
@@ -160,13 +190,40 @@ async def send_audio(websocket, stream, CHUNK, RATE, awaiting_response: asyncio.
                 print(f"音声読み取りエラー: {e}")
             return None
 
+    # RATE と CHUNK は固定なので、線形補間の参照位置と重みはブロックごとに作らず1回だけ計算する
+    # （np.interp と同じ点 x = 0, src/dst, 2*src/dst, ... < CHUNK で補間し、末尾は最後のサンプルに張り付ける）
+    resample_step = float(RATE) / 16000.0
+    resample_pos = np.arange(0, CHUNK, resample_step)
+    resample_idx0 = np.minimum(np.floor(resample_pos).astype(np.intp), CHUNK - 1)
+    resample_idx1 = np.minimum(resample_idx0 + 1, CHUNK - 1)
+    resample_frac = (resample_pos - resample_idx0).astype(np.float32)
+    resample_a = np.empty(len(resample_pos), dtype=np.int16)
+    resample_b = np.empty(len(resample_pos), dtype=np.int16)
+    resample_work = np.empty(len(resample_pos), dtype=np.float32)
+    resample_out = np.empty(len(resample_pos), dtype=np.int16)
+    resample_step_q16 = int(round(resample_step * 65536))
+    if _resample_i16_kernel is not None and RATE != 16000:
+        # 初回呼び出しのコンパイル（cache=True なら2回目以降はディスクから読む）をループ前に済ませる
+        _resample_i16_kernel(np.zeros(CHUNK, dtype=np.int16), resample_out, resample_step_q16)
+
     def _resample_int16(pcm: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+        """戻り値の配列は次のブロックで上書きされる（同じループ内で使い切ること）"""
         if src_rate == dst_rate:
             return pcm
-        ratio = float(dst_rate) / float(src_rate)
-        x_old = np.arange(len(pcm))
-        x_new = np.arange(0, len(pcm), 1.0 / ratio)
-        return np.interp(x_new, x_old, pcm.astype(np.float32)).astype(np.int16)
+        if len(pcm) != CHUNK:
+            # 想定外の長さのブロックだけ従来どおり補間する
+            x_new = np.arange(0, len(pcm), float(src_rate) / float(dst_rate))
+            return np.interp(x_new, np.arange(len(pcm)), pcm.astype(np.float32)).astype(np.int16)
+        if _resample_i16_kernel is not None:
+            _resample_i16_kernel(pcm, resample_out, resample_step_q16)
+            return resample_out
+        np.take(pcm, resample_idx0, out=resample_a)
+        np.take(pcm, resample_idx1, out=resample_b)
+        np.subtract(resample_b, resample_a, out=resample_work, dtype=np.float32)
+        np.multiply(resample_work, resample_frac, out=resample_work)
+        np.add(resample_work, resample_a, out=resample_work)
+        np.copyto(resample_out, resample_work, casting="unsafe")
+        return resample_out
 
     def is_speech_webrtc(frame_16k: np.ndarray) -> bool:
         # webrtcvad は 10/20/30ms のフレーム長のみ対応
@@ -236,7 +293,7 @@ async def send_audio(websocket, stream, CHUNK, RATE, awaiting_response: asyncio.
 
         # TTS類似でないフレームのみ送信
         if not tts_like:
-            base64_audio = base64.b64encode(audio_data).decode("utf-8")
+            base64_audio = _b64encode(audio_data).decode("ascii")
             await websocket.send(json.dumps({"type": "input_audio_buffer.append", "audio": base64_audio}))
 
         if not voice_started:
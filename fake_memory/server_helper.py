@@ -11,15 +11,6 @@ class ServerHelper:
         now = datetime.now()
         return f"{now.month}月{now.day}日"
 
-    # jsonからハロ発話を抽出
-    def get_halo_response(self, text: str) -> tuple[str, str]:
-        print(f"Response: {text}")
-        responses = text.split("\n")
-        if len(responses) == 1:
-            return responses[0], ""
-        # 1行目がメッセージ、2行目がコマンド
-        return responses[0], responses[1]
-
     # テキストファイルを読み込み、1行ごとのリストにして返す
     def read_file_lines(self, file_path: str) -> list[str]:
         try:
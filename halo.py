@@ -1,52 +1,112 @@
-import re
+import argparse
+import atexit
+import dataclasses
 import json
-import urllib.request
+import logging
+import os
+import queue
 import threading
-import asyncio
 import time
-from typing import Optional, Union
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+from itertools import chain
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Iterator, Optional, TYPE_CHECKING, Union
+
+import requests
 
 from command_selector import CommandSelector
 from llm import LLM
-from stt_azure import AzureSpeechToText
-from stt_google import GoogleSpeechToText
 from voicevox import VoiceVoxTTS
 
-from helper.halo_helper import HaloHelper
+from helper.halo_helper import HaloHelper, compile_keyword_matcher
+from helper.halo_config import HaloConfig, TTSConfig, VADConfig
 from helper.filler import Filler
 from helper.corr_gate import CorrelationGate
 from helper.asr_coherence import ASRCoherenceFilter
 from helper.vad import VAD
 from helper.similarity import TextSimilarity
+from helper.latency import LatencyTracker, TurnLatency
+from helper.semantic_cache import SemanticCache
+from helper.intents import IntentMatcher
+from helper.realtime import realtime_thread
 from halo_mcp.spotify_refresh import SpotifyRefresh
 from motor_controller import MotorController
 from halo_janome import JapaneseNounExtractor
 from voicevox_pipelined import VoiceVoxTTSPipelined
 from random_action import RandomAction
 
-class Halo:
+# STTは設定で選んだ方だけを load_stt() で読み込む（使わないSDKの読み込みで起動を遅らせない）
+if TYPE_CHECKING:
+    from stt_azure import AzureSpeechToText
+    from stt_google import GoogleSpeechToText
+
+logger = logging.getLogger("halo")
+
+# LLM待ちの裏で回すコマンド判定・モーター動作用
+_bg = ThreadPoolExecutor(max_workers=2, thread_name_prefix="halo_bg")
+# LLMへのリクエスト送信〜最初の断片待ち用（フィラー再生と並行させる）
+_llm_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="halo_llm")
+# speak_async の読み上げ用。呼び出しごとにスレッドを作らず、常駐ワーカーを使い回す
+# （止めた直前の読み上げの後片付けと重なっても次を始められるよう2本。speak() は止められたら合成の応答を待たずに戻る）
+_tts_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="halo_tts")
+# 履歴の要約は数秒かかるLLM呼び出しなので専用の1ワーカーで順に処理する（_bg のコマンド判定やフィラーを待たせない）
+_summary_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="halo_summary")
+# fake_memory サーバへの接続は使い回す
+_http = requests.Session()
+
+def _log_bg_error(fut: Future) -> None:
+    exc = fut.exception()
+    if exc is not None:
+        logger.error("バックグラウンド処理エラー: %s", exc)
+
+class TurnContext:
+    """run() の1ターン分の状態。ループ前に1度だけ生成し、ターンごとに reset() で使い回す。"""
+    __slots__ = ("idx", "user_text", "is_kaigyo", "is_command", "cache_context")
+
     def __init__(self):
+        self.idx: int = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self.user_text: str = ""
+        self.is_kaigyo: bool = False  #改行が含まれているかどうか
+        self.is_command: bool = False  #コマンド直接実行で応答したかどうか
+        self.cache_context: str = ""  #セマンティックキャッシュの文脈（直前のハロの応答）
+
+
+class Halo:
+    def __init__(self, stt_type: Optional[str] = None):
         self.halo_helper = HaloHelper()
         self.config = self.halo_helper.load_config()
 
-        self.owner_name: str = self.config["owner_name"]
-        self.your_name: str = self.config["your_name"]
-        self.run_timeout_sec: int = self.config["run_timeout_sec"]
-        self.stt_max_len: int = self.config["stt_max_len"]
-        self.stt_type: str = self.config["stt"]
-        self.llm_model: str = self.config["llm"]
-        self.tts_config: dict = self.config["voiceVoxTTS"]
-        self.change_name: dict = self.config["change_text"]
-        self.isfiller: bool = self.config["filler"]["use_filler"]
+        self.halo_config = HaloConfig.from_dict(self.config)
+        self.init_logger(self.halo_config.log_level)
+        # コマンドラインで STT を指定した場合は config.json の "stt" より優先する
+        if stt_type is not None:
+            self.halo_config = dataclasses.replace(self.halo_config, stt=stt_type)
+
+        self.owner_name: str = self.halo_config.owner_name
+        self.your_name: str = self.halo_config.your_name
+        self.run_timeout_sec: float = self.halo_config.run_timeout_sec
+        self.stt_max_len: int = self.halo_config.stt_max_len
+        self.stt_type: str = self.halo_config.stt
+        self.llm_model: str = self.halo_config.llm
+        self.tts_config: TTSConfig = self.halo_config.tts
+        self.vad_cfg: VADConfig = self.halo_config.vad
+        self.change_name: dict = self.halo_config.change_text
+        self.isfiller: bool = self.halo_config.use_filler
         self.is_need_wav_filler = True  #wav再生のフィラーが必要かどうか
-        self.filler_dir: str = self.config["filler"]["filler_dir"]
-        self.coherence_threshold: float = self.config["coherence_threshold"]
+        self.filler_dir: str = self.halo_config.filler_dir
+        self.coherence_threshold: float = self.halo_config.coherence_threshold
+        self.history_max_tokens: int = self.halo_config.history_max_tokens
+        self.history_max_turns: int = self.halo_config.history_max_turns
 
-        self.wakeup_word: str = self.config["wakeup_word"]
-        self.wakeup_word_pattern = re.compile(self.wakeup_word)
-        self.similarity_threshold: float = self.config["similarity_threshold"]
-        self.farewell_word: str = self.config["farewell_word"]
-        self.farewell_word_pattern = re.compile(self.farewell_word)
+        self.wakeup_word: str = self.halo_config.wakeup_word
+        self.is_wakeup_word = compile_keyword_matcher(self.wakeup_word)
+        self.similarity_threshold: float = self.halo_config.similarity_threshold
+        self.farewell_word: str = self.halo_config.farewell_word
+        self.is_farewell_word = compile_keyword_matcher(self.farewell_word)
 
         self.motor_controller = MotorController(self.config)
         self.command_selector = CommandSelector(general_config=self.config)
@@ -54,61 +114,111 @@ class Halo:
         self.stt = self.load_stt(self.stt_type)
         self.asr_coherence_filter = ASRCoherenceFilter()
         self.similarity = TextSimilarity()
+        # 言い直しや同じ問いかけの繰り返しはLLMを呼ばずに直近の応答を返す
+        self.semantic_cache = SemanticCache(
+            threshold=self.halo_config.semantic_cache_threshold,
+            ttl_sec=self.halo_config.semantic_cache_ttl_sec,
+        )
+        self.intent_matcher = IntentMatcher(self.halo_config.intents, self.your_name, self.owner_name)
         self.filler = Filler(self.isfiller, self.filler_dir)
         self.system_content = self.halo_helper.load_system_prompt_and_replace(self.owner_name, self.your_name)
         print(self.system_content)
-        self.janome = JapaneseNounExtractor()
+        # 形態素解析の辞書読み込みは重いので、下の起動時スレッドプールで作る
+        self.janome: Optional[JapaneseNounExtractor] = None
+        # 途中結果からのキーワードフィラー生成は _bg 上の1ワーカーで処理する（途中結果ごとにスレッド/ループを作らない）
+        self._interim_text: Optional[str] = None  # 未処理の最新の途中結果（古いものは上書き）
+        self._interim_lock = threading.Lock()
+        self._interim_running = False
         self.random_action = RandomAction(self.motor_controller, self.config)
 
         # 常時STT運用用の状態
-        self.history: str = ""
+        self.history_turns: deque[tuple[str, str]] = deque()
+        # 履歴は CommandSelector のループスレッド（exec_command の完了通知）からも追加されるので、追加・描画・参照は排他する
+        self.history_lock = threading.Lock()
+        # 履歴から溢れたターンの要約（バックグラウンドで更新）
+        self._history_summary: str = ""
         self.response: str = ""
         self.command: dict = {}
         # TTSをバックグラウンドで回すためのスレッド管理
-        self.tts_thread: Optional[threading.Thread] = None
+        self.tts_fut: Optional[Future] = None
         self.tts_lock = threading.Lock()
         # STT安定化用カウンタ
         self._stt_fail_count: int = 0
-        # fake_memory用
-        self.fake_memory_text = self.get_fake_diary_text(self.config)
-        self.fake_summary_text = self.get_fake_summary_text(self.config)
         
-        self.corr_gate = self.init_corr_gate(self.config.get("vad", {}))
+        self.corr_gate = self.init_corr_gate(self.vad_cfg)
         self.tts = self.init_tts(self.tts_config)
-        self.init_spotify()
 
-        self.tts_pipelined = VoiceVoxTTSPipelined(base_url=self.tts_config["base_url"], speaker=89, max_len=80)
+        self.tts_pipelined = VoiceVoxTTSPipelined(base_url=self.tts_config.base_url, speaker=89, max_len=80)
         self.tts_pipelined.set_params(speedScale=1.0, pitchScale=0.0, intonationScale=1.0)
-        self.tts_pipelined.start_stream(motor_controller=self.motor_controller, corr_gate=self.corr_gate, filler=self.filler, synth_workers=3, autoplay=False)
+        # STT / LLM TTFT / TTS TTFB を区間ごとに計測
+        self.latency = LatencyTracker(on_report=self.report_latency)
+        self.tts_pipelined.on_play_start = self.latency.mark_tts_first_audio
+        self.tts_pipelined.start_stream(motor_controller=self.motor_controller, corr_gate=self.corr_gate, filler=self.filler, synth_workers=3, autoplay=False, cpu_core=self.halo_config.audio_cpu_core, rt_priority=self.halo_config.audio_rt_priority)
         
-        
-        # ウォームアップ
-        self.pre_warm_up(self.stt, self.llm, self.llm_model, self.system_content)
+        # 起動時のネットワーク処理（fake_memory取得・Spotify・各ウォームアップ）は互いに独立なので並行に実行
+        with ThreadPoolExecutor(max_workers=4, thread_name_prefix="halo_init") as ex:
+            fake_diary_fut = ex.submit(self.get_fake_diary_text, self.config)
+            fake_summary_fut = ex.submit(self.get_fake_summary_text, self.config)
+            ex.submit(self.init_spotify)
+            ex.submit(self.pre_warm_up_stt)
+            ex.submit(self.pre_warm_up_tts)
+            janome_fut = ex.submit(self.init_janome, self.halo_config.tokenizer)
+            # fake_memory用
+            self.fake_memory_text = fake_diary_fut.result()
+            self.fake_summary_text = fake_summary_fut.result()
+            # LLMへ渡すシステムプロンプトは起動時に1度だけ組み立て、毎ターン同じ文字列を使う
+            self.system_memory: str = self.system_content + (self.fake_memory_text or "")
+            # LLMは本番と同じシステムプロンプト(記憶込み)で叩き、プレフィックスキャッシュを温めておく
+            ex.submit(self.pre_warm_up_llm, self.llm_model, self.system_memory)
+            self.janome = janome_fut.result()
         
 
     # ---------- init ----------
-    def init_corr_gate(self, cfg: dict) -> CorrelationGate:
+    def init_logger(self, level: str = "INFO") -> None:
+        # 環境変数 HALO_LOG_LEVEL があれば config.json の "log_level" より優先する（例: HALO_LOG_LEVEL=DEBUG）
+        logger.setLevel(os.environ.get("HALO_LOG_LEVEL", level).upper())
+        # stderrへ出すハンドラを1つだけ登録（再生成時の重複登録を防ぐ）
+        if logger.handlers:
+            return
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+        # 会話ループ側はキューに積むだけにして、stderrへの書き込みは別スレッドで行う
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+        listener = QueueListener(log_queue, handler)
+        listener.start()
+        atexit.register(listener.stop)
+        logger.addHandler(QueueHandler(log_queue))
+        logger.propagate = False
+
+    def init_janome(self, engine: str) -> JapaneseNounExtractor:
+        janome = JapaneseNounExtractor(engine=engine)
+        # 初回の解析で遅延読み込みされる分も、最初の発話より前に済ませておく
+        janome.extract("起動時のウォームアップです")
+        return janome
+
+    def init_corr_gate(self, vad_cfg: VADConfig) -> CorrelationGate:
         # 相関ゲート（TTS由来の音を抑制）をアプリ全体で共有
         corr_gate = CorrelationGate(
-            sample_rate=cfg.get("samplereate", 16000),
-            frame_ms=cfg.get("frame_duration_ms", 20),
+            sample_rate=vad_cfg.samplerate,
+            frame_ms=vad_cfg.frame_duration_ms,
             buffer_sec=1.0,
-            corr_threshold=cfg.get("corr_threshold", 0.60),
-            max_lag_ms=cfg.get("max_lag_ms", 95),
+            corr_threshold=vad_cfg.corr_threshold,
+            max_lag_ms=vad_cfg.max_lag_ms,
         )
+        corr_gate.warm_up()
         return corr_gate
 
-    def init_tts(self, tts_config: dict) -> VoiceVoxTTS:
+    def init_tts(self, tts_config: TTSConfig) -> VoiceVoxTTS:
         tts = VoiceVoxTTS(
-            base_url=tts_config["base_url"],
-            speaker=tts_config["speaker"],
-            max_len=tts_config["max_len"],
-            queue_size=tts_config["queue_size"],
+            base_url=tts_config.base_url,
+            speaker=tts_config.speaker,
+            max_len=tts_config.max_len,
+            queue_size=tts_config.queue_size,
         )
         tts.set_params(
-            speedScale=tts_config["speedScale"],
-            pitchScale=tts_config["pitchScale"],
-            intonationScale=tts_config["intonationScale"],
+            speedScale=tts_config.speedScale,
+            pitchScale=tts_config.pitchScale,
+            intonationScale=tts_config.intonationScale,
         )
         return tts
 
@@ -140,29 +250,39 @@ class Halo:
         url = fake_memory_endpoint
         print(url)
         try:
-            req = urllib.request.Request(url, headers={"Accept": "application/json"})
-            with urllib.request.urlopen(req, timeout=5) as resp:
-                charset = resp.headers.get_content_charset() or "utf-8"
-                body_text = resp.read().decode(charset, errors="replace")
-                body_text = body_text.replace(today, f"今日")
+            resp = _http.get(url, headers={"Accept": "application/json"}, timeout=5)
+            resp.raise_for_status()
+            if resp.encoding is None:
+                resp.encoding = "utf-8"
+            body_text = resp.text.replace(today, f"今日")
             data = json.loads(body_text)
             fake_memory_text = data.get("content", "") or ""
             print(fake_memory_text)
             return fake_memory_text
         except Exception as e:
             print(f"fake_memory取得エラー: {e}")
-            return
+            return ""
 
     # ---------- pre warm up ----------
-    def pre_warm_up(self, stt, llm, llm_model, system_content):
-        # プリウォーム
+    def pre_warm_up_stt(self):
         try:
-            stt.warm_up()
-            response_text = llm.generate_text(llm_model, "日本語で会話", system_content, "")
-            print(response_text)
+            self.stt.warm_up()
         except Exception as e:
             print(f"STT warm_up でエラー: {e}")
 
+    def pre_warm_up_llm(self, llm_model, system_content):
+        try:
+            response_text = self.llm.generate_text(llm_model, "日本語で会話", system_content, "")
+            print(response_text)
+        except Exception as e:
+            print(f"LLM warm_up でエラー: {e}")
+
+    def pre_warm_up_tts(self):
+        try:
+            self.tts.warm_up()
+        except Exception as e:
+            print(f"TTS warm_up でエラー: {e}")
+
 
 
     
@@ -174,17 +294,19 @@ class Halo:
         time.sleep(1)
         self.speak_async("ハロ、待機モード")
         self.random_action.reset_timer()
+        # 待機ループで毎回引く属性・設定値は先に束縛しておく
+        random_action = self.random_action.random_action
+        random_action_time = self.halo_config.random_action_time
+        waiting_frames = self.vad_cfg.waiting_min_consecutive_speech_frames
+        is_wakeup_word = self.is_wakeup_word
         while True:
-            self.random_action.random_action(self.config["random_action_time"])
-            if not self.is_vad(
-                self.config, 
-                self.config["vad"]["waiting_min_consecutive_speech_frames"]):
+            random_action(random_action_time)
+            if not self.is_vad(waiting_frames):
                 time.sleep(0.1)
                 continue
             first_text = self.stt.listen_once_fast(motor_controller=self.motor_controller)
-            if not self.wakeup_word_pattern.match(first_text):
+            if not is_wakeup_word(first_text):
                 print("ウェイクアップキーワードが含まれていません")
-                time.sleep(0.1)
                 continue
             self.speak_async("ハロ、おしゃべりする！")
             self.run()
@@ -194,41 +316,46 @@ class Halo:
 
     def run(self) -> None:
         print("========== 話しかけてください。Ctrl+Cで終了します。 ==========")
-        time_out = time.time() + self.run_timeout_sec
+        # ループ内で毎回引く設定値は先に束縛しておく
+        run_timeout_sec = self.run_timeout_sec
+        min_speech_frames = self.vad_cfg.min_consecutive_speech_frames
+        time_out = time.monotonic() + run_timeout_sec
+        turn = TurnContext()
 
         try:
             while True:
                 try:
-                    if time.time() >= time_out:
-                        print(f"タイムアウト({self.run_timeout_sec}s)により終了します。")
+                    if time.monotonic() >= time_out:
+                        print(f"タイムアウト({run_timeout_sec}s)により終了します。")
                         break
                     
                     self.stop_led()
 
-                    # VADで発話を検出
-                    if not self.is_vad(
-                        self.config, 
-                        self.config["vad"]["min_consecutive_speech_frames"]):
+                    # VADで発話を検出（会話の残り時間を過ぎたら抜けて、先頭のタイムアウト判定で終了する）
+                    if not self.is_vad(min_speech_frames, max(0.0, time_out - time.monotonic())):
                         time.sleep(0.1)
                         continue
 
                     self.is_need_wav_filler = True  #wav再生のフィラーをリセットしておく
-                    is_kaigyo = False  #改行が含まれているかどうか
+                    turn.reset()
+                    turn.idx += 1
+                    print(f"---------- turn {turn.idx} ----------")
 
                     # ユーザー発話認識(キーワード取得)
-                    user_text = self.listen_with_nouns()
-                    if not user_text or user_text == "":
-                        time.sleep(0.1)
+                    self.latency.start_turn()
+                    turn.user_text = self.listen_with_nouns()
+                    self.latency.mark_stt_end()
+                    if not turn.user_text:
                         continue
                     # ユーザー発話認識のテキスト変更(春→ハロなど)
-                    user_text = self.halo_helper.apply_text_changes(user_text, self.change_name)
-                    self.history = self.halo_helper.append_history(self.history, self.owner_name, user_text)
+                    turn.user_text = self.halo_helper.apply_text_changes(turn.user_text, self.change_name)
+                    self.add_history(self.owner_name, turn.user_text)
 
                     # 終了ワードのチェック
-                    if self.check_farewell(user_text):
+                    if self.check_farewell(turn.user_text):
                         break
                     # 文章のチェックして、正しいユーザー発話ではない場合はcontinue
-                    if self.check_sentence(user_text, self.response):
+                    if self.check_sentence(turn.user_text, self.response):
                         continue
 
                     # パイプライン再生開始
@@ -236,70 +363,101 @@ class Halo:
                     self.tts_pipelined.talk_resume()
                     # もし会話が走っていたら、その会話はスキップ
 
-                    # フィラー再生
-                    self.say_filler(self.is_need_wav_filler)
+                    # 「ありがとう」などの定型発話はLLM・コマンド判定を通さずに返す
+                    if self.respond_from_intent(turn):
+                        time_out = time.monotonic() + run_timeout_sec
+                        continue
 
-                    # コマンド直接実行の場合
-                    try:
-                        response = self.command_selector.select(user_text, self.fake_summary_text)
-                        if response:
-                            self.response = response
-                            self.history = self.halo_helper.append_history(self.history, self.your_name, self.response)
-                            self.speak_async(self.response)
-                            continue
-                    except Exception as e:
-                        print(f"コマンド実行エラー: {e}")
+                    # コマンド判定はフィラー再生・LLM呼び出しと並行して実行
+                    cmd_fut = _bg.submit(self.command_selector.select, turn.user_text, self.fake_summary_text)
 
+                    # 直前とほぼ同じ発話ならキャッシュした応答を返す
+                    if self.respond_from_cache(turn, cmd_fut):
+                        time_out = time.monotonic() + run_timeout_sec
+                        continue
+
+                    # LLMへのリクエストはフィラー再生より先に投げておく
                     print("LLMで応答を生成中...")
-                    system_memory = self.system_content + self.fake_memory_text
+                    history = self.render_history()
                     self.response = ""
-                    for delta in self.llm.stream_generate_text(self.llm_model, user_text, system_memory, self.history):
-                        if not delta:
-                            continue
-                        self.response += delta
-
-                        # 改行がきたらその時だけ流して、そのあとはパイプラインに流さない
-                        if "\n" in delta:
-                            is_kaigyo = True
-                            delta = delta.replace("\n", "")
-                            print(f"改行発生 : {delta}")
-                            self.tts_pipelined.push_text(delta)
-                        # 逐次テキスト断片をパイプラインへ投入
-                        if not is_kaigyo:
-                            self.tts_pipelined.push_text(delta)
-                        print(f"[response] {self.response}")
+                    self.latency.mark_llm_submit()
+                    llm_fut = _llm_pool.submit(self.open_llm_stream, turn.user_text, history)
+
+                    # フィラー再生
+                    self.say_filler(self.is_need_wav_filler)
+
+                    llm_stream, first_delta = llm_fut.result()
+                    try:
+                        for delta in chain((first_delta,), llm_stream):
+                            # 最初の断片を流す前にコマンド判定の結果を確認
+                            if cmd_fut is not None:
+                                turn.is_command = self.wait_command_response(cmd_fut)
+                                cmd_fut = None
+                                if turn.is_command:
+                                    break
+                            if not delta:
+                                continue
+                            self.latency.mark_llm_token()
+                            # メッセージ前の空行は読み飛ばす（先頭の改行をコマンド行との区切りと誤認しない）
+                            text = delta if self.response.strip() else delta.lstrip()
+                            self.response += delta
+
+                            # 1行目(メッセージ)だけをパイプラインへ逐次投入し、改行以降(コマンド)は流さない
+                            if not turn.is_kaigyo:
+                                head, sep, _ = text.partition("\n")
+                                if sep:
+                                    turn.is_kaigyo = True
+                                    print(f"改行発生 : {head}")
+                                if head:
+                                    self.tts_pipelined.push_text(head)
+                                # メッセージ行が終わったので、句点のない末尾もすぐ合成に回す
+                                if sep:
+                                    self.tts_pipelined.flush_ingest()
+                            logger.debug("[response] %s", self.response)
+                    finally:
+                        llm_stream.close()
+                    self.latency.mark_llm_done()
+                    if cmd_fut is not None:
+                        turn.is_command = self.wait_command_response(cmd_fut)
+                    # コマンド直接実行の場合はLLM応答を捨てる
+                    if turn.is_command:
+                        continue
 
                     # パイプライン再生中にpanを動かす
-                    self.motor_controller.motor_pan_kyoro_kyoro(1, 2)
+                    _bg.submit(self.motor_controller.motor_pan_kyoro_kyoro, 1, 2).add_done_callback(_log_bg_error)
+                    # 1行だけの応答は改行が来ないので、ここで末尾を流す
+                    if not turn.is_kaigyo:
+                        self.tts_pipelined.flush_ingest()
                     # パイプライン再生終了
                     self.tts_pipelined.talk_pause_after_flush(flush_ingest=False)
 
                     # コマンドの取り出しと履歴追加
                     self.response, self.command = self.halo_helper.get_halo_response(self.response)
-                    self.history = self.halo_helper.append_history(self.history, self.your_name, self.response)
+                    self.add_history(self.your_name, self.response)
+                    self.semantic_cache.put(turn.user_text, self.response, self.command, turn.cache_context)
                     # コマンドがあれば実行
                     self.exec_command(self.command)
                     
                     '''
-                    response_text = self.llm.generate_text(self.llm_model, user_text, system_memory, self.history)
+                    response_text = self.llm.generate_text(self.llm_model, turn.user_text, self.system_memory, history)
                     self.response = response_text
 
                     # 応答読み上げは非同期で行う
                     #self.speak_async(self.response)
                     self.tts_pipelined.push_text(self.response)
                     '''
-                    time_out = time.time() + self.run_timeout_sec    # タイムアウト時間を更新
+                    time_out = time.monotonic() + run_timeout_sec    # タイムアウト時間を更新
 
                 except KeyboardInterrupt:
                     print("\n\n音声認識ループが中断されました")
                     break
-        except Exception as e:
-            print(f"音声認識ループでエラーが発生しました: {e}")
+        except Exception:
+            logger.exception("音声認識ループでエラーが発生しました")
         finally:
             try:
                 self.stop_tts()
-                if self.tts_thread and self.tts_thread.is_alive():
-                    self.tts_thread.join(timeout=0.5)
+                if self.tts_fut is not None:
+                    wait([self.tts_fut], timeout=0.5)
             except Exception:
                 pass
             try:
@@ -315,27 +473,42 @@ class Halo:
     # ---------- stt ----------
     def listen_with_nouns(self) -> str:
         self.janome.reset_keyword_filler()
-        # 途中結果の出力用ハンドラ
-        def _on_interim(txt: str):
+        user_text = self.stt.listen_once_fast(motor_controller=self.motor_controller, on_interim=self.on_interim)
+        return user_text
+
+    # 途中結果の出力用ハンドラ
+    def on_interim(self, txt: str) -> None:
+        logger.debug("[interim] %s", txt)
+        # この発話でフィラーを言い終えていれば、ワーカーを起こすこともしない
+        if self.janome.is_speak_filler:
+            return
+        with self._interim_lock:
+            self._interim_text = txt
+            if self._interim_running:
+                return
+            self._interim_running = True
+        _bg.submit(self._keyword_worker).add_done_callback(_log_bg_error)
+
+    def _keyword_worker(self) -> None:
+        """溜まっている最新の途中結果がなくなるまでキーワードフィラーを作る"""
+        while True:
+            with self._interim_lock:
+                txt = self._interim_text
+                self._interim_text = None
+                if txt is None:
+                    self._interim_running = False
+                    return
             try:
-                print(f"[interim] {txt}")
-                def _task():
-                    try:
-                        # 普通名詞・固有名詞でフィラーを生成
-                        keyword_filler = asyncio.run(self.janome.make_keyword_filler_async(txt, self.your_name))
-                        if keyword_filler != "":
-                            print(f"[keyword_filler] {keyword_filler}")
-                            if self.tts_pipelined.is_object_playing():
-                                self.tts_pipelined.barge_in("バージイン", mode="hard_nonstop_wav") #バージンは初回言わないバグがあるための対応
-                            self.tts_pipelined.push_text(keyword_filler)
-                            self.is_need_wav_filler = False
-                    except Exception:
-                        pass
-                threading.Thread(target=_task, daemon=True).start()
+                # 普通名詞・固有名詞でフィラーを生成
+                keyword_filler = self.janome.make_keyword_filler(txt, self.your_name)
+                if keyword_filler != "":
+                    print(f"[keyword_filler] {keyword_filler}")
+                    if self.tts_pipelined.is_object_playing():
+                        self.tts_pipelined.barge_in("バージイン", mode="hard_nonstop_wav") #バージンは初回言わないバグがあるための対応
+                    self.tts_pipelined.push_text(keyword_filler)
+                    self.is_need_wav_filler = False
             except Exception:
-                pass
-        user_text = self.stt.listen_once_fast(motor_controller=self.motor_controller, on_interim=_on_interim)
-        return user_text
+                logger.exception("キーワードフィラー生成エラー")
 
     # ---------- tts control ----------
     def stop_tts(self) -> None:
@@ -347,35 +520,111 @@ class Halo:
     def speak_async(self, text: str) -> VoiceVoxTTS:
         # 進行中があれば停止
         with self.tts_lock:
-            self.stop_tts()
+            # 前の読み上げを止め、今回の stop_event をここで確保する
+            # （ワーカーが speak() に着く前の stop_tts() も、この event に届くので取りこぼさない）
+            stop_event = self.tts.begin_utterance()
             self.motor_controller.led_stop_blink()
             self.motor_controller.stop_motor()
-            # 再生停止の完了を待つ（短時間）
-            try:
-                # まずはスレッドの終了を待機
-                if self.tts_thread and self.tts_thread.is_alive():
-                    self.tts_thread.join(timeout=1.0)
-            except Exception as e:
-                print(f"TTSスレッド終了エラー: {e}")
+            # 前のスレッドは stop() で自分の読み上げだけを止めて抜けるので、終了は待たない
             
             def _run():
+                if stop_event.is_set():
+                    return
                 try:
                     self.motor_controller.motor_pan_kyoro_kyoro(1, 2)
-                    self.tts.speak(text, self.motor_controller, corr_gate=self.corr_gate, filler=self.filler)
-                except Exception as e:
-                    print(f"TTSエラー: {e}")
+                    self.tts.speak(text, self.motor_controller, corr_gate=self.corr_gate, filler=self.filler, stop_event=stop_event)
+                except Exception:
+                    logger.exception("TTSエラー")
 
-            self.tts_thread = threading.Thread(target=_run, daemon=True)
-            self.tts_thread.start()
+            self.tts_fut = _tts_pool.submit(_run)
         return self.tts
 
+    def report_latency(self, turn: TurnLatency) -> None:
+        logger.info(
+            "stt.latency_ms=%.1f llm.ttft_ms=%.1f llm.total_ms=%.1f tts.ttfb_ms=%.1f response_ms=%.1f",
+            turn.stt_ms, turn.llm_ttft_ms, turn.llm_total_ms, turn.tts_ttfb_ms, turn.response_ms,
+        )
+
     # ----------メカ------------------
     def stop_led(self):
         """パイプライン再生が終了したらled停止"""
         if not self.tts_pipelined.is_object_playing():
             self.motor_controller.led_stop_blink() #led停止
 
+    # ---------- 会話履歴 ----------
+    def add_history(self, name: str, message: str) -> None:
+        """履歴に追加し、溢れたターンはバックグラウンドで要約に畳み込む"""
+        # 上限を超えたら半分まで一度に落とし、要約の呼び出しを数ターンに1回にまとめる
+        with self.history_lock:
+            evicted = self.halo_helper.append_history_turn(self.history_turns, name, message, self.history_max_tokens, self.history_max_turns, trim_ratio=0.5)
+        if evicted:
+            _summary_pool.submit(self.summarize_history, evicted).add_done_callback(_log_bg_error)
+
+    def render_history(self) -> str:
+        """LLMに渡す履歴文字列（要約＋直近のターン）"""
+        with self.history_lock:
+            return self.halo_helper.render_history(self.history_turns, self._history_summary)
+
+    def summarize_history(self, evicted: list[tuple[str, str]]) -> None:
+        # _summary_pool の1ワーカーでしか呼ばれないので、要約の読み書きにロックは要らない
+        lines = "".join(f"{name}: {message}\n" for name, message in evicted)
+        prompt = f"これまでの要約:\n{self._history_summary}\n\n追加の会話:\n{lines}\n以上をまとめて200文字以内の要約にしてください。"
+        summary = self.llm.generate_text(self.llm_model, prompt, "あなたは会話履歴を簡潔に要約するアシスタントです。", "")
+        self._history_summary = (summary or "").strip()
+        logger.info("history summary updated: %s", self._history_summary)
+
+    def open_llm_stream(self, user_text: str, history: str) -> tuple[Iterator[str], Optional[str]]:
+        """LLMへストリーミングのリクエストを送り、最初の断片が届くまで待つ（_llm_pool 上で呼ぶ）"""
+        llm_stream = self.llm.stream_generate_text(self.llm_model, user_text, self.system_memory, history)
+        return llm_stream, next(llm_stream, None)
+
+    def respond_from_intent(self, turn: TurnContext) -> bool:
+        """定型発話なら決まった返答を読み上げ、Trueを返す"""
+        response = self.intent_matcher.match(turn.user_text)
+        if response is None:
+            return False
+        self.response, self.command = response, ""
+        self.tts_pipelined.push_text(self.response)
+        self.tts_pipelined.flush_ingest()
+        self.tts_pipelined.talk_pause_after_flush(flush_ingest=False)
+        self.add_history(self.your_name, self.response)
+        return True
+
+    def respond_from_cache(self, turn: TurnContext, cmd_fut: Future) -> bool:
+        """キャッシュにヒットしたらLLMを呼ばずに応答し、Trueを返す"""
+        # 今回の発話は追加済みなので、その1つ前（直前のハロの応答）を文脈にする
+        with self.history_lock:
+            turn.cache_context = self.history_turns[-2][1] if len(self.history_turns) >= 2 else ""
+        cached = self.semantic_cache.get(turn.user_text, turn.cache_context)
+        if cached is None:
+            return False
+        # コマンド直接実行が優先
+        turn.is_command = self.wait_command_response(cmd_fut)
+        if turn.is_command:
+            return True
+        # コマンド付きの応答はキャッシュされないので、ヒット時は読み上げだけでコマンドは実行しない
+        self.response, self.command = cached, ""
+        self.tts_pipelined.push_text(self.response)
+        self.tts_pipelined.flush_ingest()
+        self.tts_pipelined.talk_pause_after_flush(flush_ingest=False)
+        self.add_history(self.your_name, self.response)
+        return True
+
     # ---------- コマンド実行 ----------
+    def wait_command_response(self, cmd_fut: Future) -> bool:
+        """コマンド直接実行の結果を待ち、応答があれば読み上げてTrueを返す"""
+        try:
+            response = cmd_fut.result()
+        except Exception:
+            logger.exception("コマンド実行エラー")
+            return False
+        if not response:
+            return False
+        self.response = response
+        self.add_history(self.your_name, self.response)
+        self.speak_async(self.response)
+        return True
+
     def exec_command(self, command: str) -> str:
         if self.command == "":
             return
@@ -388,33 +637,54 @@ class Halo:
                     result = f.result()
                     if result:
                         self.response = result['result']
-                        self.history = self.halo_helper.append_history(self.history, self.your_name, self.response)
+                        self.add_history(self.your_name, self.response)
                         print(f"[command_response] {self.response}")
                         self.speak_async(self.response)
-                except Exception as e:
-                    print(f"[command_error] {e}")
+                except Exception:
+                    logger.exception("[command_error]")
             fut.add_done_callback(_on_done)
 
 
     # ---------- 会話ロジック ----------
-    def is_vad(self, config: dict, min_consecutive_speech_frames: int) -> bool:
-        print("VAD detection start")
+    def is_vad(self, min_consecutive_speech_frames: int, timeout_sec: Optional[float] = None) -> bool:
+        """発話を検出するまでブロックする。timeout_sec を過ぎたら False"""
+        logger.debug("VAD detection start")
+        # 待ち受けの間だけ、このスレッドを音声用コア・リアルタイム優先度に切り替える
+        with realtime_thread(self.halo_config.audio_cpu_core, self.halo_config.audio_rt_priority):
+            return self._listen_vad(min_consecutive_speech_frames, timeout_sec)
+
+    def _listen_vad(self, min_consecutive_speech_frames: int, timeout_sec: Optional[float]) -> bool:
+        if self.vad_cfg.engine == "silero":
+            is_vad = VAD.listen_until_voice_silero(
+                model_path=self.vad_cfg.silero_model_path,
+                samplerate=self.vad_cfg.samplerate,
+                # しきい値は webrtc のフレーム数で設定しているので時間に直して渡す
+                min_speech_ms=min_consecutive_speech_frames * self.vad_cfg.frame_duration_ms,
+                threshold=self.vad_cfg.silero_threshold,
+                device=None,
+                timeout_seconds=timeout_sec,
+                corr_gate=self.corr_gate,
+                stop_event=None,
+            )
+            if is_vad:
+                logger.debug("VAD detected")
+            return is_vad
         is_vad = VAD.listen_until_voice_webrtc(
-            aggressiveness=config["vad"]["aggressiveness"],
-            samplerate=config["vad"]["samplereate"],
-            frame_duration_ms=config["vad"]["frame_duration_ms"],
+            aggressiveness=self.vad_cfg.aggressiveness,
+            samplerate=self.vad_cfg.samplerate,
+            frame_duration_ms=self.vad_cfg.frame_duration_ms,
             min_consecutive_speech_frames=min_consecutive_speech_frames,
             device=None,
-            timeout_seconds=None,
+            timeout_seconds=timeout_sec,
             corr_gate=self.corr_gate,
             stop_event=None,
         )
         if is_vad:
-            print("VAD detected")
+            logger.debug("VAD detected")
         return is_vad
 
     def check_farewell(self, txt: str) -> bool:
-        if self.farewell_word_pattern.match(txt):
+        if self.is_farewell_word(txt):
             farewell = "バイバイ！"
             print(f"{self.your_name}: {farewell}")
             self.tts.speak(farewell, self.motor_controller, corr_gate=self.corr_gate)
@@ -423,10 +693,10 @@ class Halo:
 
     def check_sentence(self, user_text: str, response: str) -> bool:
         if len(user_text) > self.stt_max_len:
-            print(f"ユーザー発話がしきい値を超えています :txt: {user_text} :threshold: {self.stt_max_len}")
+            logger.info("ユーザー発話がしきい値を超えています :txt: %s :threshold: %s", user_text, self.stt_max_len)
             return True
         if self.is_similarity_threshold(user_text, response):
-            print(f"類似度がしきい値を超えています :txt: {user_text} :response: {response}")
+            logger.info("類似度がしきい値を超えています :txt: %s :response: %s", user_text, response)
             return True
         """
         if self.is_coherence_threshold(user_text, self.coherence_threshold):
@@ -451,13 +721,18 @@ class Halo:
 
     def is_similarity_threshold(self, user_text: str, response: str) -> bool:
         # 類似度（ユーザ確定テキスト vs 応答テキストの一部）
+        if not self.response or not user_text:
+            return False
         score = 0.0
         try:
+            # 上限値がしきい値未満なら部分文字列の総当たりを省く
+            if self.similarity.upper_bound(user_text, self.response) < self.similarity_threshold:
+                return False
             # print(f"類似度計算 :user_text: {user_text} :response: {self.response}")
             score, best_sub = self.similarity.calc_max_substring_similarity(user_text, self.response)
-            print(f"類似度: {score * 100:.1f}%  一致抜粋: {best_sub[:80]}")
+            logger.debug("類似度: %.1f%%  一致抜粋: %s", score * 100, best_sub[:80])
         except Exception as e:
-            print(f"類似度計算エラー: {e}")
+            logger.warning("類似度計算エラー: %s", e)
         return score >= self.similarity_threshold
 
     def is_coherence_threshold(self, txt: str, threshold: float) -> bool:
@@ -475,10 +750,12 @@ class Halo:
         return False
 
     # ---------- STT ----------
-    def load_stt(self,stt_type: str) -> Union[AzureSpeechToText, GoogleSpeechToText]:
+    def load_stt(self, stt_type: str) -> Union["AzureSpeechToText", "GoogleSpeechToText"]:
         if stt_type == "azure":
+            from stt_azure import AzureSpeechToText
             return AzureSpeechToText()
         elif stt_type == "google":
+            from stt_google import GoogleSpeechToText
             return GoogleSpeechToText()
         else:
             raise ValueError(f"Invalid STT type: {stt_type}")
@@ -486,5 +763,8 @@ class Halo:
     
 
 if __name__ == "__main__":
-    halo = Halo()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stt", choices=("azure", "google"), default=None, help="config.json の stt を上書きする")
+    args = parser.parse_args()
+    halo = Halo(stt_type=args.stt)
     halo.main_loop()
\ No newline at end of file
@@ -1,21 +1,57 @@
 # 使う前に必要ならインストールしてください:
 # pip install janome
 # （SudachiPyも使う場合）pip install sudachipy sudachidict-core
+# （fugashi/MeCabを使う場合）pip install fugashi unidic-lite
 
+from functools import lru_cache
 from typing import List, Iterable, Literal, Optional
+import logging
 import os
 import json
-import asyncio
 import random
 
+# 既定のキーワードフィラー定義（import 時に絶対パスで1回だけ解決する）
+_KEYWORD_FILLER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyword_filler.json")
+
+logger = logging.getLogger("halo.janome")
+
+
+@lru_cache(maxsize=4)
+def _get_tokenizer(engine: str):
+    """辞書の読み込みが重いので、エンジンごとにトークナイザを1つだけ作ってインスタンス間で共有する"""
+    if engine == 'janome':
+        from janome.tokenizer import Tokenizer
+        udic_path = "./janome_dictionary/user_dictionary.csv"
+        # ユーザー辞書は任意（置いていない環境ではシステム辞書だけで動かす）
+        if os.path.exists(udic_path):
+            return Tokenizer(udic=udic_path, udic_enc="utf8")
+        return Tokenizer()
+    if engine == 'sudachi':
+        # SudachiPy は辞書が必要です。標準辞書: sudachidict-core
+        from sudachipy import dictionary
+        return dictionary.Dictionary().create()
+    if engine == 'fugashi':
+        # UniDic（unidic-lite）前提
+        from fugashi import Tagger
+        return Tagger()
+    raise ValueError("engine must be 'janome', 'sudachi' or 'fugashi'")
+
+
+@lru_cache(maxsize=4)
+def _read_keyword_templates(json_path: str):
+    # 読み込み結果は共有するので、呼び出し側では書き換えない
+    with open(json_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
 class JapaneseNounExtractor:
     """
     日本語の形態素解析を行い、一般名詞 or 固有名詞のみを返すユーティリティ。
-    engine='janome'（既定）または 'sudachi' を選べます。
+    engine='janome'（既定）、'sudachi'、'fugashi' を選べます。
+    fugashi は MeCab の C 実装を使うため、途中結果ごとに呼ぶ用途では Janome より大幅に速い。
 
     Parameters
     ----------
-    engine : Literal['janome', 'sudachi']
+    engine : Literal['janome', 'sudachi', 'fugashi']
         使用する形態素解析エンジン。既定は 'janome'。
     normalize : bool
         見出し語（基本形）で返すかどうか。既定 True（表記ゆれを抑えたいときに便利）。
@@ -23,9 +59,14 @@ class JapaneseNounExtractor:
         重複を削除して返すか。既定 False（出現順を保持）。
     """
 
+    _JANOME_NOUN_POS1 = frozenset(('一般', '固有名詞'))
+    # Sudachi は辞書により末端の語が'一般'になる場合がある
+    _SUDACHI_NOUN_POS1 = frozenset(('普通名詞', '一般', '固有名詞'))
+    _UNIDIC_NOUN_POS2 = frozenset(('普通名詞', '固有名詞'))
+
     def __init__(
         self,
-        engine: Literal['janome', 'sudachi'] = 'janome',
+        engine: Literal['janome', 'sudachi', 'fugashi'] = 'janome',
         normalize: bool = True,
         unique: bool = False,
     ):
@@ -35,25 +76,19 @@ class JapaneseNounExtractor:
         self.count = 0
         self.is_speak_filler = False
         self.list_keyword_templates = self.load_keyword_templates()
+        # フィラーの定型文は途中結果ごとに辞書を辿らないよう、起動時に取り出しておく
+        obj = self.list_keyword_templates or {}
+        kw = obj.get("keyword", {}) if isinstance(obj, dict) else {}
+        self._filler_templates: tuple = tuple(kw.get("keyword_filler", []))
 
-        if engine == 'janome':
-            from janome.tokenizer import Tokenizer
-            udic_path = "./janome_dictionary/user_dictionary.csv"
-            self._tokenizer = Tokenizer(udic=udic_path, udic_enc="utf8")
-        elif engine == 'sudachi':
-            # SudachiPy は辞書が必要です。標準辞書: sudachidict-core
-            from sudachipy import dictionary, tokenizer
-            self._tokenizer = dictionary.Dictionary().create()
+        self._tokenizer = _get_tokenizer(engine)
+        if engine == 'sudachi':
+            from sudachipy import tokenizer
             self._mode = tokenizer.Tokenizer.SplitMode.C  # C=最長単位、A=細かく
-        else:
-            raise ValueError("engine must be 'janome' or 'sudachi'")
 
     def load_keyword_templates(self, path: Optional[str] = None):
         try:
-            base_dir = os.path.dirname(__file__)
-            json_path = path or os.path.join(base_dir, "keyword_filler.json")
-            with open(json_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = _read_keyword_templates(path or _KEYWORD_FILLER_PATH)
             # そのまま辞書形式で保持・返却（結合しない）
             self.list_keyword_templates = data
             return data
@@ -71,17 +106,14 @@ class JapaneseNounExtractor:
 
         if self.engine == 'janome':
             nouns = self._extract_janome(text)
+        elif self.engine == 'fugashi':
+            nouns = self._extract_fugashi(text)
         else:
             nouns = self._extract_sudachi(text)
 
         if self.unique:
-            seen = set()
-            deduped = []
-            for n in nouns:
-                if n not in seen:
-                    seen.add(n)
-                    deduped.append(n)
-            return deduped
+            # dict は挿入順を保つので、出現順のまま重複を除ける
+            return list(dict.fromkeys(nouns))
         return nouns
 
     # 関数呼び出し風に使えるように
@@ -94,20 +126,26 @@ class JapaneseNounExtractor:
           名詞,一般 / 名詞,固有名詞,人名,... / 名詞,サ変接続 など
         """
         results: List[str] = []
+        # 途中結果ごとに呼ばれるので、ループ内の属性参照はローカルに逃がしておく
+        append = results.append
+        allowed = self._JANOME_NOUN_POS1
+        normalize = self.normalize
         for t in self._tokenizer.tokenize(text):
-            pos = t.part_of_speech.split(',')  # e.g. ['名詞', '固有名詞', '一般', '*']
-            if pos[0] != '名詞':
+            pos = t.part_of_speech  # e.g. '名詞,固有名詞,一般,*'
+            if not pos.startswith('名詞,'):
                 continue
             # 一般名詞または固有名詞だけ採用
-            is_common = len(pos) > 1 and pos[1] == '一般'
-            is_proper = len(pos) > 1 and pos[1] == '固有名詞'
-            if not (is_common or is_proper):
+            if pos.split(',', 2)[1] not in allowed:
                 continue
 
-            surface = t.base_form if self.normalize and t.base_form != '*' else t.surface
-            # 空文字/記号除去の簡易チェック
-            if surface and surface.isascii() is False or surface:
-                results.append(surface)
+            surface = t.surface
+            if normalize:
+                base = t.base_form
+                if base != '*':
+                    surface = base
+            # 英字の名詞（Spotify など）も残すので、空文字だけを除く
+            if surface:
+                append(surface)
         return results
 
     # --- 内部実装: SudachiPy ---
@@ -118,13 +156,10 @@ class JapaneseNounExtractor:
         '普通名詞' or '固有名詞' を対象にします。
         """
         results: List[str] = []
+        allowed = self._SUDACHI_NOUN_POS1
         for m in self._tokenizer.tokenize(text, self._mode):
             pos = m.part_of_speech()  # tuple
-            if len(pos) < 2 or pos[0] != '名詞':
-                continue
-            is_common = pos[1] in ('普通名詞', '一般')  # dictにより末端の語が'一般'になる場合がある
-            is_proper = pos[1] == '固有名詞'
-            if not (is_common or is_proper):
+            if pos[0] != '名詞' or len(pos) < 2 or pos[1] not in allowed:
                 continue
 
             surface = m.normalized_form() if self.normalize else m.surface()
@@ -132,6 +167,25 @@ class JapaneseNounExtractor:
                 results.append(surface)
         return results
     
+    # --- 内部実装: fugashi (MeCab + UniDic) ---
+    def _extract_fugashi(self, text: str) -> List[str]:
+        """
+        UniDic の品詞体系（例）:
+          pos1='名詞', pos2='普通名詞' / '固有名詞'
+        """
+        results: List[str] = []
+        allowed = self._UNIDIC_NOUN_POS2
+        for w in self._tokenizer(text):
+            f = w.feature
+            if f.pos1 != '名詞' or f.pos2 not in allowed:
+                continue
+            # lemma は「イベント-event」のように語源が付くことがあるので orthBase（書字形基本形）を使う
+            base = getattr(f, 'orthBase', None)
+            surface = base if self.normalize and base and base != '*' else w.surface
+            if surface:
+                results.append(surface)
+        return results
+
     def pos_all(self, text: str) -> List[dict]:
         """
         与えられた文章を形態素解析し、各トークンの品詞情報を配列で返します。
@@ -145,6 +199,8 @@ class JapaneseNounExtractor:
             return []
         if self.engine == 'janome':
             return self._pos_all_janome(text)
+        if self.engine == 'fugashi':
+            return self._pos_all_fugashi(text)
         return self._pos_all_sudachi(text)
 
     # --- 内部実装: 品詞一覧出力 (Janome) ---
@@ -162,6 +218,20 @@ class JapaneseNounExtractor:
             })
         return list_tokens
 
+    # --- 内部実装: 品詞一覧出力 (fugashi) ---
+    def _pos_all_fugashi(self, text: str) -> List[dict]:
+        list_tokens: List[dict] = []
+        for w in self._tokenizer(text):
+            f = w.feature
+            base = getattr(f, 'orthBase', None) or w.surface
+            list_tokens.append({
+                'surface': w.surface,
+                'base': base,
+                'pos': [f.pos1, f.pos2, f.pos3, f.pos4],
+                'reading': getattr(f, 'kana', None),
+            })
+        return list_tokens
+
     # --- 内部実装: 品詞一覧出力 (Sudachi) ---
     def _pos_all_sudachi(self, text: str) -> List[dict]:
         list_tokens: List[dict] = []
@@ -176,25 +246,22 @@ class JapaneseNounExtractor:
             })
         return list_tokens
         
-    async def make_keyword_filler_async(self, text: str, your_name: str) -> str:
-        nouns = await asyncio.to_thread(self.extract, text)
+    def make_keyword_filler(self, text: str, your_name: str) -> str:
+        # この発話でフィラーを言い終えていれば、形態素解析自体をしない
+        if self.is_speak_filler:
+            return ""
+        nouns = self.extract(text)
         # your_name を除外
         try:
             listNouns = [n for n in nouns if your_name not in n]
         except Exception:
             listNouns = nouns
-        print(listNouns)
-        if listNouns != [] and not self.is_speak_filler:
+        logger.debug("nouns: %s", listNouns)
+        if listNouns != []:
             self.count += 1
             if self.count >= 2:
                 self.is_speak_filler = True
-                # 辞書形式から個別リストを参照（結合しない）
-                obj = self.list_keyword_templates or {}
-                kw = obj.get("keyword", {}) if isinstance(obj, dict) else {}
-                list_main = kw.get("keyword_filler", [])
-                list_add = kw.get("keyword_filler_add", [])
-
-                return_message = random.choice(list_main).format(keyword=listNouns[0], your_name=your_name)
+                return_message = random.choice(self._filler_templates).format(keyword=listNouns[0], your_name=your_name)
                 #return_message += random.choice(list_add).format(keyword=nouns[0])
                 return return_message
         return ""
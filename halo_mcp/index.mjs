@@ -1,6 +1,7 @@
 // index.mjs
 // npm i @openai/agents
 import { Agent, run, MCPServerStdio, MCPServerStreamableHttp } from "@openai/agents";
+import readline from "node:readline";
 
 // Brave（検索）— 同一PCで子プロセス起動（stdio）
 const brave = new MCPServerStdio({
@@ -52,11 +53,10 @@ listServers.push(await connectSafe(playwright, "playwright"));
 listServers.push(await connectSafe(spotify, "spotify"));
 const activeServers = listServers.filter(Boolean);
 
-try {
-  const agent = new Agent({
-    name: "multi-mcp-agent",
-    model: "gpt-4o-mini",
-    instructions: `
+const agent = new Agent({
+  name: "multi-mcp-agent",
+  model: "gpt-4o-mini",
+  instructions: `
 あなたはMCPツールを使ってユーザーの依頼を解決します。
 - Web/ニュース/画像の検索: 「brave」
 - 実ブラウザ操作: 「playwright」
@@ -64,19 +64,10 @@ try {
 - 電気の操作: 「switchbot」
 - 出典URLや実行手順を簡潔に示し、日本語で答える。
 - あなたはガンダムのハロです。ハロ、電気をつけた。など片言で返信する。`,
-    mcpServers: activeServers,
-  });
-
-  const query =
-    process.argv[2] ??
-    "switchbotで電気をオン";
-  const result = await run(agent, query);
+  mcpServers: activeServers,
+});
 
-  process.stdout.write(JSON.stringify({ output: result.finalOutput }) + "\n");
-} catch (e) {
-  console.error(e?.stack || String(e));
-  process.exitCode = 1;
-} finally {
+async function closeServers() {
   const listToClose = [];
   if (activeServers.includes(brave)) listToClose.push(brave.close());
   if (activeServers.includes(playwright)) listToClose.push(playwright.close());
@@ -84,3 +75,40 @@ try {
   if (activeServers.includes(switchbot)) listToClose.push(switchbot.close());
   await Promise.allSettled(listToClose);
 }
+
+if (process.argv[2] === "--stdio") {
+  // 常駐モード: 1行1件の JSON {"query": ...} を受け取り、1行の JSON で返す。
+  // MCPサーバーへの接続とNodeの起動は最初の1回だけで済む（mcp_call.py の MCPClient が使う）
+  const rl = readline.createInterface({ input: process.stdin, terminal: false });
+  try {
+    for await (const line of rl) {
+      if (!line.trim()) continue;
+      let reply;
+      try {
+        const { query } = JSON.parse(line);
+        const result = await run(agent, query);
+        reply = { output: result.finalOutput };
+      } catch (e) {
+        console.error(e?.stack || String(e));
+        reply = { error: String(e?.message || e) };
+      }
+      process.stdout.write(JSON.stringify(reply) + "\n");
+    }
+  } finally {
+    await closeServers();
+  }
+} else {
+  try {
+    const query =
+      process.argv[2] ??
+      "switchbotで電気をオン";
+    const result = await run(agent, query);
+
+    process.stdout.write(JSON.stringify({ output: result.finalOutput }) + "\n");
+  } catch (e) {
+    console.error(e?.stack || String(e));
+    process.exitCode = 1;
+  } finally {
+    await closeServers();
+  }
+}
@@ -1,6 +1,30 @@
 # mcp_call.py
 import subprocess, json, shutil, os, asyncio
 
+# orjson があれば応答JSONの解析に使う（bytes をそのまま渡せるので decode も省ける）
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+
+def _parse_reply_line(line: bytes):
+    """応答行を JSON として読む。改行なしのログが前後に付いた行は最初の { から最後の } までを読み直す"""
+    try:
+        return _json_loads(line)
+    except ValueError:
+        pass
+    # 正規表現（.* と re.S）で全体を舐めず、find/rfind の線形走査で切り出す
+    i = line.find(b"{")
+    j = line.rfind(b"}")
+    if i < 0 or j <= i:
+        return None
+    try:
+        return _json_loads(line[i:j + 1])
+    except ValueError:
+        return None
+
 
 class MCPClient:
     """Brave (MCP) エージェント呼び出し用クライアント。"""
@@ -24,48 +48,99 @@ class MCPClient:
             base_env.update(extra_env)
         self.env = base_env
 
-    async def call(self, query: str) -> str:
-        # Nodeプロセスを非同期で起動し、stdout/stderr を受け取る
-        proc = await asyncio.create_subprocess_exec(
+        # index.mjs を --stdio で常駐させ、Node起動とMCPサーバー接続を呼び出し間で使い回す（初回の call で起動）
+        self._proc: "asyncio.subprocess.Process | None" = None
+        self._lock: "asyncio.Lock | None" = None  # 1プロセスに1件ずつ問い合わせる（呼び出し側のループ上で作る）
+        self.stdout_limit = 1 << 20  # 1行のJSON応答の上限（既定の64KBでは長い検索結果が切れる）
+
+    async def _ensure_proc(self) -> "asyncio.subprocess.Process":
+        if self._proc is not None and self._proc.returncode is None:
+            return self._proc
+        # stderr はパイプにせず親へ流す（読み出さないパイプが詰まって Node が止まるのを防ぐ）
+        self._proc = await asyncio.create_subprocess_exec(
             self.node_path,
             self.script_path,
-            query,
+            "--stdio",
+            stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
             env=self.env,
+            limit=self.stdout_limit,
         )
+        return self._proc
 
-        stdout_bytes, stderr_bytes = await proc.communicate()
-        stdout = (stdout_bytes or b"").decode("utf-8", errors="replace").strip()
-        stderr = (stderr_bytes or b"").decode("utf-8", errors="replace").strip()
+    async def call(self, query: str) -> str:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            proc = await self._ensure_proc()
+            try:
+                data = await self._exchange(proc, query)
+            except BaseException:
+                # 応答には id がないので、読み切れずに抜けた（キャンセル・1行の上限超えなど）プロセスを使い回すと
+                # 次の call が前の問い合わせの応答を読んでしまう。捨てて次回起動し直す
+                self._discard_proc(proc)
+                raise
 
-        if proc.returncode != 0:
-            raise RuntimeError(f"Node script failed (code {proc.returncode}).\nSTDERR:\n{stderr}")
+        if "error" in data:
+            raise RuntimeError(f"Node script failed: {data['error']}")
+        return data["output"]
 
-        # もし他のログが混ざる可能性がある場合に備え、先頭/末尾のJSON行を拾う簡易ガード
-        # ここでは素直に1行JSONを想定（index.mjs側がJSONのみをconsole.logする前提）。
+    async def _exchange(self, proc: "asyncio.subprocess.Process", query: str):
+        """1件書き込み、対応する応答行（output/error を持つJSON）を読んで返す"""
         try:
-            data = json.loads(stdout)
-        except json.JSONDecodeError:
-            # 万一混ざったら、波括弧の最初と最後を抜く簡易フォールバック
-            import re
-            m = re.search(r"\{.*\}", stdout, flags=re.S)
-            if not m:
-                raise RuntimeError(f"JSONの解析に失敗しました。STDOUT:\n{stdout}\n\nSTDERR:\n{stderr}")
-            data = json.loads(m.group(0))
+            proc.stdin.write((json.dumps({"query": query}, ensure_ascii=False) + "\n").encode("utf-8"))
+            await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise RuntimeError(f"Node script is not running: {e}")
 
-        return data["output"]
+        # 応答は1行JSON。ライブラリのログ行が混ざった場合は読み飛ばす
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                code = await proc.wait()
+                raise RuntimeError(f"Node script exited (code {code}).")
+            data = _parse_reply_line(line)
+            if data is None:
+                continue
+            if isinstance(data, dict) and ("output" in data or "error" in data):
+                return data
+
+    def _discard_proc(self, proc: "asyncio.subprocess.Process") -> None:
+        if self._proc is proc:
+            self._proc = None
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+
+    async def close(self) -> None:
+        """常駐中の Node プロセスを終了する（stdin を閉じると index.mjs 側がMCPサーバーを閉じて抜ける）"""
+        proc, self._proc = self._proc, None
+        if proc is None or proc.returncode is not None:
+            return
+        proc.stdin.close()
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=5.0)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
 
 
 def call_brave_agent(query: str) -> str:
     """後方互換の同期ラッパー。内部で MCPClient.call を実行。"""
-    client = MCPClient()
-    return asyncio.run(client.call(query))
+    async def _call_once() -> str:
+        client = MCPClient()
+        try:
+            return await client.call(query)
+        finally:
+            await client.close()
+
+    return asyncio.run(_call_once())
 
 if __name__ == "__main__":
-    client = MCPClient()
-    # ans = asyncio.run(client.call("https://news.ycombinator.com にアクセスして、'new' を開いてタイトルを3件教えて。そのあと30秒待って"))
-    # ans = asyncio.run(client.call("超魔界村について調べて"))
-    ans = asyncio.run(client.call("switchbotを使って電気をオン"))
+    # ans = call_brave_agent("https://news.ycombinator.com にアクセスして、'new' を開いてタイトルを3件教えて。そのあと30秒待って")
+    # ans = call_brave_agent("超魔界村について調べて")
+    ans = call_brave_agent("switchbotを使って電気をオン")
     print("=== Python received ===")
     print(ans)
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 from typing import List, Optional, Tuple
-from collections import Counter
+from collections import Counter, OrderedDict
+import logging
 import re, math
 
+logger = logging.getLogger("halo.asr_coherence")
+
 class ASRCoherenceFilter:
     """
     音声認識テキストの破綻検知＆クレンジング
@@ -22,6 +25,9 @@ class ASRCoherenceFilter:
         self.min_fragment_chars = min_fragment_chars
         self.fillers = set(self.DEFAULT_FILLERS)
         self._embedder = None  # lazy load
+        # 同じ誤認識テキストの再評価はスコアを使い回す（しきい値は後で比べるのでキーは本文だけ）
+        self._score_cache: "OrderedDict[str, float]" = OrderedDict()
+        self.cache_size = 128
 
     # ====== 公開API ======
     def coherence_score(self, text: str) -> float:
@@ -59,8 +65,15 @@ class ASRCoherenceFilter:
 
     def is_noisy(self, text: str, threshold: Optional[float] = None) -> Tuple[bool, float]:
         th = self.noisy_threshold if threshold is None else threshold
-        score = self.coherence_score(text)
-        print(f"破綻度: {score} :threshold: {th}")
+        score = self._score_cache.get(text)
+        if score is None:
+            score = self.coherence_score(text)
+            self._score_cache[text] = score
+            if len(self._score_cache) > self.cache_size:
+                self._score_cache.popitem(last=False)
+        else:
+            self._score_cache.move_to_end(text)
+        logger.debug("破綻度: %s :threshold: %s", score, th)
         return score < th, score
 
     def clean_text(self, text: str, min_keep: int = 2) -> str:
@@ -101,6 +114,7 @@ class ASRCoherenceFilter:
         for w in words:
             if w:
                 self.fillers.add(w)
+        self._score_cache.clear()
 
     def set_noisy_threshold(self, value: float):
         self.noisy_threshold = float(value)
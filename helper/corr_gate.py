@@ -1,8 +1,61 @@
 # corr_gate.py
 import numpy as np
-from collections import deque
 import threading
 
+# numba があればラグ探索をJITコンパイルして回す（無ければNumPy版で同じ計算をする）
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _xcorr_best_numpy(x: np.ndarray, nx: float, ref: np.ndarray, step: int, th: float) -> float:
+    """x(平均除去済み, ノルムnx)と ref の各ラグ区間の正規化相関の最大値。th に達したらそこで打ち切る"""
+    L = len(x)
+    best = 0.0
+    for s in range(0, len(ref) - L + 1, step):
+        seg = ref[s:s+L].astype(np.float32)
+        seg -= seg.mean()
+        ns = np.linalg.norm(seg)
+        if ns == 0:
+            continue
+        r = float(np.dot(x, seg) / (nx * ns))
+        if r > best:
+            best = r
+            if best >= th:
+                break
+    return best
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True, boundscheck=False)
+    def _xcorr_best_jit(x, nx, ref, step, th):
+        L = x.shape[0]
+        best = 0.0
+        for s in range(0, ref.shape[0] - L + 1, step):
+            mean = 0.0
+            for i in range(L):
+                mean += ref[s + i]
+            mean /= L
+            dot = 0.0
+            ss = 0.0
+            for i in range(L):
+                v = ref[s + i] - mean
+                dot += x[i] * v
+                ss += v * v
+            if ss == 0.0:
+                continue
+            r = dot / (nx * np.sqrt(ss))
+            if r > best:
+                best = r
+                if best >= th:
+                    break
+        return best
+
+    _xcorr_best = _xcorr_best_jit
+else:
+    _xcorr_best = _xcorr_best_numpy
+
 class CorrelationGate:
     """
     TTSの再生PCM（far-end）をためておき、マイクのフレーム（near-end）と
@@ -15,58 +68,80 @@ class CorrelationGate:
         self.sr = sample_rate
         self.frame = int(sample_rate * frame_ms / 1000)
         self.maxlen = int(sample_rate * buffer_sec)
-        self.buf = deque(maxlen=self.maxlen)  # int16
+        # far-end はリングバッファ(int16)に直接書き込む。毎フレームの list→ndarray 変換をしない
+        self._ring = np.zeros(self.maxlen, dtype=np.int16)
+        self._write = 0   # 次の書き込み位置
+        self._filled = 0  # 有効サンプル数
         self.lock = threading.Lock()
         self.th = corr_threshold
         self.max_lag = int(sample_rate * max_lag_ms / 1000)
+        # is_tts_like 用の作業領域（float32）。フレーム長が変わった時だけ確保し直す
+        self._x_buf = np.zeros(self.frame, dtype=np.float32)
+        self._ref_buf = np.zeros(self.frame + self.max_lag, dtype=np.float32)
+
+    def reset(self):
+        """バッファを再確保せずに空にする"""
+        with self.lock:
+            self._write = 0
+            self._filled = 0
 
     def publish_farend(self, pcm_int16: np.ndarray):
         if pcm_int16 is None or len(pcm_int16) == 0:
             return
-        if pcm_int16.ndim > 1:
-            pcm_int16 = pcm_int16.reshape(-1)
+        pcm = np.asarray(pcm_int16, dtype=np.int16).reshape(-1)
+        n = len(pcm)
+        if n >= self.maxlen:
+            pcm = pcm[-self.maxlen:]
+            n = self.maxlen
         with self.lock:
-            self.buf.extend(pcm_int16.tolist())
+            end = self._write + n
+            if end <= self.maxlen:
+                self._ring[self._write:end] = pcm
+            else:
+                k = self.maxlen - self._write
+                self._ring[self._write:] = pcm[:k]
+                self._ring[:n - k] = pcm[k:]
+            self._write = end % self.maxlen
+            self._filled = min(self.maxlen, self._filled + n)
 
-    def _normalized_dot(self, a: np.ndarray, b: np.ndarray) -> float:
-        # 平均除去 → 正規化内積（-1..1）
-        a = a.astype(np.float32)
-        b = b.astype(np.float32)
-        a -= a.mean()
-        b -= b.mean()
-        na = np.linalg.norm(a)
-        nb = np.linalg.norm(b)
-        if na == 0 or nb == 0:
-            return 0.0
-        return float(np.dot(a, b) / (na * nb))
+    def _tail_into(self, out: np.ndarray) -> int:
+        """直近 len(out) サンプルを古い順に out へ書き込み、書いたサンプル数を返す（確保・中間コピーなし）"""
+        with self.lock:
+            n = min(len(out), self._filled)
+            start = (self._write - n) % self.maxlen
+            k = min(n, self.maxlen - start)
+            out[:k] = self._ring[start:start + k]
+            if k < n:
+                out[k:n] = self._ring[:n - k]
+            return n
 
     def is_tts_like(self, frame_int16: np.ndarray) -> bool:
         """TrueならTTS由来と判断して無視してよい"""
         if frame_int16 is None or len(frame_int16) == 0:
             return False
-        with self.lock:
-            ref = np.array(self.buf, dtype=np.int16)
-        L = len(frame_int16)
-        if len(ref) < L:
+        frame = np.asarray(frame_int16).reshape(-1)
+        L = len(frame)
+        if len(self._x_buf) != L:
+            self._x_buf = np.zeros(L, dtype=np.float32)
+            self._ref_buf = np.zeros(L + self.max_lag, dtype=np.float32)
+        # 探索に使うのは末尾 L+max_lag サンプルだけ（作業領域へ直接書き込む）
+        n = self._tail_into(self._ref_buf)
+        if n < L:
+            return False
+        ref = self._ref_buf[:n]
+
+        # 近端フレームの平均除去・ノルムはラグごとに計算し直さない
+        x = self._x_buf
+        np.subtract(frame, frame.mean(), out=x, casting="unsafe")
+        nx = np.linalg.norm(x)
+        if nx == 0:
             return False
 
-        # 末尾のLサンプルを中心に、±max_lagの範囲で簡易ラグ探索（ステップ=10ms/2）
+        # 末尾のLサンプルを中心に、-max_lagの範囲で簡易ラグ探索（ステップ=10ms/2）
         step = max(1, self.frame // 2)
-        start = max(0, len(ref) - L - self.max_lag)
-        end = len(ref) - L + self.max_lag + 1
-        if start >= end:
-            start = max(0, len(ref) - L)
-            end = len(ref) - L + 1
+        return _xcorr_best(x, float(nx), ref, step, float(self.th)) >= self.th
 
-        x = frame_int16.astype(np.int16)
-        best = 0.0
-        for s in range(start, end, step):
-            seg = ref[s:s+L]
-            if len(seg) != L:
-                continue
-            r = self._normalized_dot(x, seg)
-            if r > best:
-                best = r
-                if best >= self.th:
-                    return True
-        return False
+    def warm_up(self):
+        """JIT版のコンパイルを起動時に済ませ、最初のフレームで待たせない"""
+        x = np.ones(self.frame, dtype=np.float32)
+        _xcorr_best(x, 1.0, np.zeros(self.frame * 2, dtype=np.float32), max(1, self.frame // 2), float(self.th))
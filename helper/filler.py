@@ -1,11 +1,11 @@
-from helper.wav_player import WavPlayer
-
 class Filler:
     player = None
     isfiller = False
     def __init__(self, is_filler: bool, filler_dir: str):
         self.isfiller = is_filler
         if is_filler:
+            # フィラーを使う時だけ pyaudio を読み込む
+            from helper.wav_player import WavPlayer
             self.player = WavPlayer()
             self.player.preload_dir(filler_dir)
 
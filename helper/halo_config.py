@@ -0,0 +1,154 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Union
+
+
+def _keyword_pattern(value: Union[str, list], default: str) -> str:
+    """ウェイクアップ/終了ワードは正規表現の文字列か語のリスト。リストなら「.*(A|B).*」にまとめる"""
+    if isinstance(value, list):
+        words = [re.escape(str(w)) for w in value if w]
+        return f".*({'|'.join(words)}).*" if words else default
+    return str(value)
+
+
+@dataclass(frozen=True)
+class VADConfig:
+    """config.json の "vad" セクション"""
+    samplerate: int = 16000
+    frame_duration_ms: int = 20
+    waiting_min_consecutive_speech_frames: int = 12
+    min_consecutive_speech_frames: int = 2
+    corr_threshold: float = 0.60
+    max_lag_ms: int = 95
+    cooldown_ms: int = 1000
+    aggressiveness: int = 3
+    engine: str = "webrtc"
+    silero_model_path: str = "./silero_vad.onnx"
+    silero_threshold: float = 0.5
+
+    def __post_init__(self):
+        if self.frame_duration_ms not in (10, 20, 30):
+            raise ValueError("vad.frame_duration_ms must be one of 10, 20, 30")
+        if self.samplerate not in (8000, 16000, 32000, 48000):
+            raise ValueError("vad.samplereate must be one of 8000, 16000, 32000, 48000")
+        if self.aggressiveness not in (0, 1, 2, 3):
+            raise ValueError("vad.aggressiveness must be one of 0, 1, 2, 3")
+        if self.engine not in ("webrtc", "silero"):
+            raise ValueError("vad.engine must be 'webrtc' or 'silero'")
+        if self.engine == "silero" and self.samplerate not in (8000, 16000):
+            raise ValueError("vad.engine 'silero' needs vad.samplereate 8000 or 16000")
+
+    @classmethod
+    def from_dict(cls, cfg: dict) -> "VADConfig":
+        return cls(
+            # config.json 側のキー名は "samplereate"（互換のためそのまま読む）
+            samplerate=int(cfg.get("samplereate", cls.samplerate)),
+            frame_duration_ms=int(cfg.get("frame_duration_ms", cls.frame_duration_ms)),
+            waiting_min_consecutive_speech_frames=int(cfg.get("waiting_min_consecutive_speech_frames", cls.waiting_min_consecutive_speech_frames)),
+            min_consecutive_speech_frames=int(cfg.get("min_consecutive_speech_frames", cls.min_consecutive_speech_frames)),
+            corr_threshold=float(cfg.get("corr_threshold", cls.corr_threshold)),
+            max_lag_ms=int(cfg.get("max_lag_ms", cls.max_lag_ms)),
+            cooldown_ms=int(cfg.get("cooldown_ms", cls.cooldown_ms)),
+            aggressiveness=int(cfg.get("aggressiveness", cls.aggressiveness)),
+            engine=str(cfg.get("engine", cls.engine)),
+            silero_model_path=str(cfg.get("silero_model_path", cls.silero_model_path)),
+            silero_threshold=float(cfg.get("silero_threshold", cls.silero_threshold)),
+        )
+
+
+@dataclass(frozen=True)
+class TTSConfig:
+    """config.json の "voiceVoxTTS" セクション"""
+    base_url: str = "http://127.0.0.1:50021"
+    speaker: int = 89
+    max_len: int = 80
+    queue_size: int = 4
+    speedScale: float = 1.0
+    pitchScale: float = 0.0
+    intonationScale: float = 1.0
+
+    @classmethod
+    def from_dict(cls, cfg: dict) -> "TTSConfig":
+        return cls(
+            base_url=str(cfg.get("base_url", cls.base_url)),
+            speaker=int(cfg.get("speaker", cls.speaker)),
+            max_len=int(cfg.get("max_len", cls.max_len)),
+            queue_size=int(cfg.get("queue_size", cls.queue_size)),
+            speedScale=float(cfg.get("speedScale", cls.speedScale)),
+            pitchScale=float(cfg.get("pitchScale", cls.pitchScale)),
+            intonationScale=float(cfg.get("intonationScale", cls.intonationScale)),
+        )
+
+
+@dataclass(frozen=True)
+class HaloConfig:
+    """
+    config.json を型付きで保持する設定オブジェクト。
+    ホットパスでは dict の多段参照ではなく属性アクセスで値を読む。
+    """
+    owner_name: str = "まつ"
+    your_name: str = "ハロ"
+    stt: str = "azure"
+    llm: str = "gpt-4o-mini"
+    wakeup_word: str = ".*(ハロ|しゃべり|喋|話).*"
+    farewell_word: str = ".*(バイバイ|さようなら|終了).*"
+    run_timeout_sec: float = 120.0
+    stt_max_len: int = 50
+    history_max_tokens: int = 2000
+    history_max_turns: int = 16
+    use_filler: bool = False
+    filler_dir: str = "./filler"
+    change_text: Dict[str, str] = field(default_factory=dict)
+    similarity_threshold: float = 0.70
+    coherence_threshold: float = 0.10
+    random_action_time: float = 60.0
+    tokenizer: str = "janome"
+    semantic_cache_threshold: float = 0.92
+    semantic_cache_ttl_sec: float = 60.0
+    intents: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    audio_cpu_core: int = -1
+    audio_rt_priority: int = 0
+    log_level: str = "INFO"
+    tts: TTSConfig = field(default_factory=TTSConfig)
+    vad: VADConfig = field(default_factory=VADConfig)
+
+    def __post_init__(self):
+        if self.stt not in ("azure", "google"):
+            raise ValueError(f"Invalid STT type: {self.stt}")
+        if self.tokenizer not in ("janome", "sudachi", "fugashi"):
+            raise ValueError(f"Invalid tokenizer: {self.tokenizer}")
+        if self.log_level.upper() not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+            raise ValueError(f"Invalid log_level: {self.log_level}")
+
+    @classmethod
+    def from_dict(cls, cfg: dict) -> "HaloConfig":
+        filler = cfg.get("filler", {})
+        semantic_cache = cfg.get("semantic_cache", {})
+        realtime = cfg.get("realtime", {})
+        return cls(
+            owner_name=str(cfg.get("owner_name", cls.owner_name)),
+            your_name=str(cfg.get("your_name", cls.your_name)),
+            stt=str(cfg.get("stt", cls.stt)),
+            llm=str(cfg.get("llm", cls.llm)),
+            wakeup_word=_keyword_pattern(cfg.get("wakeup_word", cls.wakeup_word), cls.wakeup_word),
+            farewell_word=_keyword_pattern(cfg.get("farewell_word", cls.farewell_word), cls.farewell_word),
+            run_timeout_sec=float(cfg.get("run_timeout_sec", cls.run_timeout_sec)),
+            stt_max_len=int(cfg.get("stt_max_len", cls.stt_max_len)),
+            history_max_tokens=int(cfg.get("history_max_tokens", cls.history_max_tokens)),
+            history_max_turns=int(cfg.get("history_max_turns", cls.history_max_turns)),
+            use_filler=bool(filler.get("use_filler", cls.use_filler)),
+            filler_dir=str(filler.get("filler_dir", cls.filler_dir)),
+            change_text=dict(cfg.get("change_text", {})),
+            similarity_threshold=float(cfg.get("similarity_threshold", cls.similarity_threshold)),
+            coherence_threshold=float(cfg.get("coherence_threshold", cls.coherence_threshold)),
+            random_action_time=float(cfg.get("random_action_time", cls.random_action_time)),
+            tokenizer=str(cfg.get("tokenizer", cls.tokenizer)),
+            semantic_cache_threshold=float(semantic_cache.get("threshold", cls.semantic_cache_threshold)),
+            semantic_cache_ttl_sec=float(semantic_cache.get("ttl_sec", cls.semantic_cache_ttl_sec)),
+            intents=dict(cfg.get("intents", {})),
+            audio_cpu_core=int(realtime.get("audio_cpu_core", cls.audio_cpu_core)),
+            audio_rt_priority=int(realtime.get("audio_rt_priority", cls.audio_rt_priority)),
+            log_level=str(cfg.get("log_level", cls.log_level)),
+            tts=TTSConfig.from_dict(cfg.get("voiceVoxTTS", {})),
+            vad=VADConfig.from_dict(cfg.get("vad", {})),
+        )
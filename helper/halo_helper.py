@@ -1,13 +1,72 @@
+import copy
 import json
 import os
+import re
+from collections import deque
 from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+
+# 設定ファイルはプロセス内で1度だけ読み込む（再生成時にJSONを再パースしない）
+@lru_cache(maxsize=1)
+def _load_config_raw(config_path: str) -> dict:
+    return json.loads(Path(config_path).read_bytes())
+
+
+# システムプロンプト中のプレースホルダ（1パスで置換する）
+_PLACEHOLDER_RE = re.compile(r"\{(owner_name|your_name)\}")
+
+
+# 「ハロ:」「ハロ：」のような名前の接頭辞
+@lru_cache(maxsize=8)
+def _name_prefix_re(your_name: str) -> re.Pattern:
+    return re.compile(rf"{re.escape(your_name)}[:：]")
+
+
+# change_text の置換対象を1つの選択パターンにまとめる（長いキーを優先して1パスで置換）
+@lru_cache(maxsize=8)
+def _change_text_re(keys: tuple) -> Optional[re.Pattern]:
+    keys = sorted((k for k in keys if k), key=len, reverse=True)
+    if not keys:
+        return None
+    return re.compile("|".join(re.escape(k) for k in keys))
+
+
+# 置換対象がすべて1文字なら、正規表現ではなく str.translate の変換表で置換する
+@lru_cache(maxsize=8)
+def _change_text_table(items: tuple) -> Optional[dict]:
+    if not items or any(len(k) != 1 for k, _ in items):
+        return None
+    return str.maketrans(dict(items))
+
+
+# 「.*(A|B|C).*」形式のキーワードパターン（メタ文字を含まない候補のみ）
+_KEYWORD_ALT_RE = re.compile(r"\.\*\(([^()\[\]{}\\.*+?^$]+)\)\.\*")
+
+
+def compile_keyword_matcher(pattern: str) -> Callable[[str], bool]:
+    """
+    ウェイクアップ/終了ワード判定用のマッチャを返す。
+    「.*(A|B|C).*」形式ならバックトラックする re.match ではなく部分文字列検索で判定し、
+    それ以外の正規表現はコンパイル済みパターンの match を使う（STTが先頭に付ける空白は読み飛ばす）。
+    空文字・None は常に False。
+    """
+    m = _KEYWORD_ALT_RE.fullmatch(pattern)
+    if m:
+        keywords = tuple(k for k in m.group(1).split("|") if k)
+        return lambda text: bool(text) and any(k in text for k in keywords)
+    _match = re.compile(pattern).match
+    return lambda text: bool(text) and _match(text.lstrip()) is not None
+
 
 class HaloHelper:
     # 設定ファイルの読み込み
     def load_config(self, config_path: str = "config.json") -> dict:
+        # パース結果はキャッシュを共有するので、呼び出し側が書き換えても他に波及しないよう複製して返す
         try:
-            with open(config_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return copy.deepcopy(_load_config_raw(config_path))
         except FileNotFoundError:
             return self._get_default_config()
         except json.JSONDecodeError:
@@ -45,47 +104,84 @@ class HaloHelper:
                 s = f.read()
         except Exception:
             s = "あなたはアシスタントです。"
-        s = s.replace("{owner_name}", owner_name)
-        s = s.replace("{your_name}", your_name)
-        return s
+        names = {"owner_name": owner_name, "your_name": your_name}
+        return _PLACEHOLDER_RE.sub(lambda m: names[m.group(1)], s)
 
     # ユーザー発話認識のテキスト変更(春→ハロなど)
     def apply_text_changes(self, text: str, change_text_map: dict) -> str:
         if not change_text_map:
             return text
-        result = text
         try:
-            for key, value in change_text_map.items():
-                if key in result:
-                    result = result.replace(key, value)
+            table = _change_text_table(tuple(change_text_map.items()))
+            if table is not None:
+                return text.translate(table)
+            pattern = _change_text_re(tuple(change_text_map))
         except Exception:
-            pass
-        return result
+            return text
+        if pattern is None:
+            return text
+        return pattern.sub(lambda m: change_text_map[m.group(0)], text)
 
     # ハロ発話から不要な単語を削除
     def replace_dont_need_word(self, text: str, your_name: str) -> str:
         try:
-            text = text.replace(f"{your_name}:", "")
-            text = text.replace(f"{your_name}：", "")
+            text = _name_prefix_re(your_name).sub("", text)
         except Exception:
             pass
         return text
 
-    # 履歴にユーザー発話を追加
-    def append_history(self, history: str, name: str, message: str) -> str:
-        line = f"{name}: {message}\n"
-        print(line)
-        history = history + line
-        return history
+    # 履歴に発話を追加し、ターン数上限・トークン予算を超えた古いターンを先頭から取り出して返す
+    # trim_ratio < 1 なら、超えた時に上限×trim_ratio まで一度に落とす（溢れるたびに1件ずつ返さない）
+    def append_history_turn(self, history_turns: deque, name: str, message: str, max_tokens: int = 2000, max_turns: int = 16, trim_ratio: float = 1.0) -> list[tuple[str, str]]:
+        print(f"{name}: {message}\n")
+        history_turns.append((name, message))
+        evicted: list[tuple[str, str]] = []
+        chars = sum(len(m) for _, m in history_turns)
+        if len(history_turns) <= max_turns and chars // 3 <= max_tokens:
+            return evicted
+        keep_turns = max(1, int(max_turns * trim_ratio))
+        keep_tokens = int(max_tokens * trim_ratio)
+        while len(history_turns) > 1 and (len(history_turns) > keep_turns or chars // 3 > keep_tokens):
+            turn = history_turns.popleft()
+            chars -= len(turn[1])
+            evicted.append(turn)
+        return evicted
+
+    # 履歴のトークン数を概算（日本語はおおよそ3文字=1トークン）
+    def estimate_history_tokens(self, history_turns: deque) -> int:
+        return sum(len(message) for _, message in history_turns) // 3
+
+    # LLMに渡す履歴テキストを組み立てる（要約があれば先頭に置く）
+    def render_history(self, history_turns: deque, summary: str = "") -> str:
+        head = f"（これまでの会話の要約）{summary}\n" if summary else ""
+        return head + "".join(f"{name}: {message}\n" for name, message in history_turns)
 
     # jsonからハロ発話を抽出
+    def iter_message_tokens(self, stream: Iterable[str], parts: list) -> Iterator[str]:
+        """LLMの出力断片を parts に貯めつつ、1行目(メッセージ)の部分だけを yield する"""
+        in_message = True
+        started = False
+        for delta in stream:
+            parts.append(delta)
+            if not in_message:
+                continue
+            # メッセージ前の空行は読み飛ばす
+            text = delta if started else delta.lstrip()
+            if not text:
+                continue
+            started = True
+            head, sep, _ = text.partition("\n")
+            if head:
+                yield head
+            if sep:
+                in_message = False
+
     def get_halo_response(self, text: str) -> tuple[str, str]:
         print(f"Response: {text}")
-        responses = text.split("\n")
-        if len(responses) == 1:
-            return responses[0], ""
-        # 1行目がメッセージ、2行目がコマンド
-        return responses[0], responses[1]
+        # 1行目がメッセージ、2行目がコマンド。前後の空白や間の空行があっても崩れないようにする
+        message, _, rest = text.strip().partition("\n")
+        command = rest.strip().partition("\n")[0].strip()
+        return message.strip(), command
 
     def get_today(self):
         return datetime.now().strftime("%Y%m%d")
@@ -0,0 +1,46 @@
+import re
+import time
+from typing import Dict, Optional
+
+# 発話末尾の句読点・空白（STTが付ける「。」など）は照合前に落とす
+_TRAILING_PUNCT = "。、．，！？!?　 "
+
+
+class IntentMatcher:
+    """
+    「ありがとう」「おやすみ」「今何時」のような短い定型発話を、LLMやコマンド判定を通さずに返答する。
+    - intents: {名前: {"pattern": 正規表現, "response": 返答テンプレート}}（config.json の "intents"）
+    - 全パターンを名前付きグループの1本の正規表現にまとめ、発話全体との fullmatch 1回で判定する
+    - 返答テンプレートでは {your_name} {owner_name} {hour} {minute} が使える
+    """
+
+    def __init__(self, intents: Dict[str, Dict[str, str]], your_name: str = "", owner_name: str = ""):
+        self.your_name = your_name
+        self.owner_name = owner_name
+        self._responses: Dict[str, str] = {}
+        parts = []
+        for name, intent in intents.items():
+            pattern = intent.get("pattern", "")
+            if not name.isidentifier() or not pattern:
+                print(f"intent {name} は無効なため無視します")
+                continue
+            parts.append(f"(?P<{name}>{pattern})")
+            self._responses[name] = intent.get("response", "")
+        self._re: Optional[re.Pattern] = re.compile("|".join(parts)) if parts else None
+
+    def match(self, text: str) -> Optional[str]:
+        """定型発話なら返答文を、そうでなければ None を返す"""
+        if self._re is None or not text:
+            return None
+        m = self._re.fullmatch(text.rstrip(_TRAILING_PUNCT))
+        if m is None:
+            return None
+        now = time.localtime()
+        response = self._responses[m.lastgroup].format(
+            your_name=self.your_name,
+            owner_name=self.owner_name,
+            hour=now.tm_hour,
+            minute=now.tm_min,
+        )
+        print(f"[intent] {m.lastgroup}")
+        return response or None
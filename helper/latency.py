@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Optional
+
+
+@dataclass
+class TurnLatency:
+    """1ターン分の各区間の時刻（time.perf_counter 基準, 秒）"""
+    t_stt_start: float = 0.0
+    t_stt_end: float = 0.0
+    t_llm_submit: float = 0.0
+    t_llm_first: float = 0.0
+    t_llm_last: float = 0.0
+    t_tts_submit: float = 0.0
+    t_tts_first: float = 0.0
+    llm_done: bool = False
+    reported: bool = False
+
+    @staticmethod
+    def _ms(start: float, end: float) -> float:
+        if start <= 0.0 or end <= 0.0:
+            return 0.0
+        return (end - start) * 1000.0
+
+    @property
+    def stt_ms(self) -> float:
+        """発話開始待ち〜確定まで（EOU遅延を含む）"""
+        return self._ms(self.t_stt_start, self.t_stt_end)
+
+    @property
+    def llm_ttft_ms(self) -> float:
+        return self._ms(self.t_llm_submit, self.t_llm_first)
+
+    @property
+    def llm_total_ms(self) -> float:
+        return self._ms(self.t_llm_submit, self.t_llm_last)
+
+    @property
+    def tts_ttfb_ms(self) -> float:
+        return self._ms(self.t_tts_submit, self.t_tts_first)
+
+    @property
+    def response_ms(self) -> float:
+        """STT確定〜最初の音声再生まで（ユーザーが感じる応答遅延）"""
+        return self._ms(self.t_stt_end, self.t_tts_first)
+
+
+class LatencyTracker:
+    """
+    ターンごとの STT / LLM TTFT / LLM total / TTS TTFB を記録する。
+    - mark_*() は perf_counter を記録するだけなので、ホットパスに置いてよい
+    - LLM完了とTTSの最初の再生が揃った時点で1ターン分を確定し、直近 history_size ターンを保持する
+    """
+
+    def __init__(self, on_report: Optional[Callable[[TurnLatency], None]] = None, history_size: int = 20):
+        self.current = TurnLatency()
+        self.history: Deque[TurnLatency] = deque(maxlen=history_size)
+        self._on_report = on_report
+        self._lock = threading.Lock()
+
+    def start_turn(self) -> None:
+        with self._lock:
+            self.current = TurnLatency(t_stt_start=time.perf_counter())
+
+    def mark_stt_end(self) -> None:
+        self.current.t_stt_end = time.perf_counter()
+
+    def mark_llm_submit(self) -> None:
+        self.current.t_llm_submit = time.perf_counter()
+
+    def mark_llm_token(self) -> None:
+        now = time.perf_counter()
+        turn = self.current
+        if turn.t_llm_first == 0.0:
+            turn.t_llm_first = now
+            turn.t_tts_submit = now
+        turn.t_llm_last = now
+
+    def mark_llm_done(self) -> None:
+        self.current.llm_done = True
+        self._maybe_report()
+
+    def mark_tts_first_audio(self) -> None:
+        """TTSの再生開始ごとに呼ばれる。LLM応答の最初の再生だけを記録する。"""
+        turn = self.current
+        if turn.t_tts_submit == 0.0 or turn.t_tts_first != 0.0:
+            return
+        turn.t_tts_first = time.perf_counter()
+        self._maybe_report()
+
+    def _maybe_report(self) -> None:
+        with self._lock:
+            turn = self.current
+            if turn.reported or not turn.llm_done or turn.t_tts_first == 0.0:
+                return
+            turn.reported = True
+            self.history.append(turn)
+        if self._on_report is not None:
+            self._on_report(turn)
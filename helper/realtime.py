@@ -0,0 +1,52 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+# 権限不足・非Linux の警告は1回だけ出す
+_warned = False
+
+
+def _warn_once(msg: str) -> None:
+    global _warned
+    if not _warned:
+        _warned = True
+        print(msg)
+
+
+@contextmanager
+def realtime_thread(cpu_core: int = -1, rt_priority: int = 0) -> Iterator[None]:
+    """
+    呼び出しスレッドだけを cpu_core に固定し、rt_priority > 0 なら SCHED_FIFO にする（Linux のみ）。
+    - cpu_core < 0 / rt_priority <= 0 ならその設定は変えない
+    - 抜けるときに元の CPU 割り当て・スケジューリングへ戻す
+    - root でない・対応していない環境では何もせずに続行する
+    """
+    saved_affinity = None
+    saved_policy = None
+    if cpu_core >= 0:
+        try:
+            saved_affinity = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, {cpu_core})
+        except (AttributeError, OSError) as e:
+            saved_affinity = None
+            _warn_once(f"音声スレッドのCPU固定をスキップします: {e}")
+    if rt_priority > 0:
+        try:
+            saved_policy = (os.sched_getscheduler(0), os.sched_getparam(0))
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(rt_priority))
+        except (AttributeError, OSError) as e:
+            saved_policy = None
+            _warn_once(f"音声スレッドのリアルタイム優先度設定をスキップします: {e}")
+    try:
+        yield
+    finally:
+        if saved_policy is not None:
+            try:
+                os.sched_setscheduler(0, *saved_policy)
+            except OSError:
+                pass
+        if saved_affinity is not None:
+            try:
+                os.sched_setaffinity(0, saved_affinity)
+            except OSError:
+                pass
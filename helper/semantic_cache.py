@@ -0,0 +1,90 @@
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    直近のユーザー発話 → 応答 を保持し、ほぼ同じ発話が来たらLLMを呼ばずに返す。
+    - コマンド付きの応答はキャッシュしない（ヒットのたびに検索などの副作用を繰り返し、
+      しかも応答文が新しいコマンド結果を反映しないため）
+    - 発話は文字bigramをハッシュした固定長の出現回数ベクトルに埋め込み、int8 とノルムで保持する
+      （回数は小さい整数なので int8 で誤差なく持て、float32 の1/4のメモリで済む）
+    - 検索は保持中の全ベクトルとの整数内積1回（N×d の行列×ベクトル, int32累算）をノルムで割る
+    - 「今何時？」のように答えが変わる質問もあるため、ttl_sec を過ぎたものは使わない
+    - 「うん」「それで？」のように直前の流れで答えが変わる発話もあるため、context（直前の応答など）の
+      ハッシュも一緒に保持し、一致する行だけを候補にする
+    """
+
+    def __init__(self, maxlen: int = 256, threshold: float = 0.92, ttl_sec: float = 60.0, dim: int = 512):
+        self.maxlen = maxlen
+        self.threshold = threshold
+        self.ttl_sec = ttl_sec
+        self.dim = dim
+        self._codes = np.zeros((maxlen, dim), dtype=np.int8)
+        self._norms = np.ones(maxlen, dtype=np.float32)
+        self._times = np.full(maxlen, -np.inf, dtype=np.float64)
+        self._contexts = np.zeros(maxlen, dtype=np.int64)
+        self._entries: List[Optional[str]] = [None] * maxlen
+        self._count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, text: str) -> Tuple[np.ndarray, float]:
+        """(int8 の出現回数ベクトル, そのL2ノルム) を返す"""
+        v = np.zeros(self.dim, dtype=np.int32)
+        s = "".join(text.split())
+        if len(s) == 1:
+            v[hash(s) % self.dim] = 1
+        for i in range(len(s) - 1):
+            v[hash(s[i:i + 2]) % self.dim] += 1
+        np.clip(v, 0, 127, out=v)
+        n = float(np.sqrt(np.dot(v, v)))
+        return v.astype(np.int8), n
+
+    @staticmethod
+    def _context_key(context: str) -> int:
+        return hash(context) & 0x7FFFFFFFFFFFFFFF
+
+    def get(self, text: str, context: str = "") -> Optional[str]:
+        """context が一致し、しきい値以上に近い発話があれば応答を返す"""
+        if not text:
+            return None
+        v, n = self._embed(text)
+        if n == 0:
+            return None
+        ctx = self._context_key(context)
+        with self._lock:
+            if self._count == 0:
+                return None
+            dots = np.einsum("ij,j->i", self._codes[:self._count], v, dtype=np.int32)
+            sims = dots / (self._norms[:self._count] * n)
+            # 期限切れ・文脈違いの行は argmax の前に候補から外す
+            valid = (self._times[:self._count] >= time.monotonic() - self.ttl_sec) & (self._contexts[:self._count] == ctx)
+            sims = np.where(valid, sims, -np.inf)
+            i = int(np.argmax(sims))
+            entry = self._entries[i]
+            score = float(sims[i])
+        if entry is None or score < self.threshold:
+            return None
+        print(f"[semantic_cache] hit score={score:.3f}")
+        return entry
+
+    def put(self, text: str, response: str, command: str, context: str = "") -> None:
+        if not text or not response or command:
+            return
+        v, n = self._embed(text)
+        if n == 0:
+            return
+        ctx = self._context_key(context)
+        with self._lock:
+            i = self._next
+            self._codes[i] = v
+            self._norms[i] = n
+            self._times[i] = time.monotonic()
+            self._contexts[i] = ctx
+            self._entries[i] = response
+            self._next = (i + 1) % self.maxlen
+            self._count = min(self._count + 1, self.maxlen)
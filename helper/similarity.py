@@ -1,4 +1,5 @@
 import difflib
+from collections import Counter, OrderedDict
 
 
 class TextSimilarity:
@@ -12,6 +13,23 @@ class TextSimilarity:
         self.max_ratio_window = max_ratio_window
         self.coarse_step_divisor = max(1, coarse_step_divisor)
         self.fine_step_divisor = max(1, fine_step_divisor)
+        # 同じ (a, b) の再評価（割り込み判定の再試行など）は前回の結果を返す
+        self._cache: "OrderedDict[tuple[str, str], tuple[float, str]]" = OrderedDict()
+        self.cache_size = 64
+
+    def upper_bound(self, a: str, b: str) -> float:
+        """
+        calc_max_substring_similarity の上限値を O(len(a)+len(b)) で見積もる。
+        一致文字数 M は共通文字数 c 以下なので、ratio = 2M/(len(a)+L) <= 2c/(len(a)+c)。
+        """
+        a_norm = a.strip()
+        b_norm = b.strip()
+        if not a_norm or not b_norm:
+            return 0.0
+        common = min(sum((Counter(a_norm) & Counter(b_norm)).values()), len(a_norm))
+        if common == 0:
+            return 0.0
+        return 2.0 * common / (len(a_norm) + common)
 
     def calc_max_substring_similarity(self, a: str, b: str) -> tuple[float, str]:
         """
@@ -22,7 +40,18 @@ class TextSimilarity:
             return 0.0, ""
         a_norm = a.strip()
         b_norm = b.strip()
+        key = (a_norm, b_norm)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+        result = self._calc_max_substring_similarity(a_norm, b_norm)
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
 
+    def _calc_max_substring_similarity(self, a_norm: str, b_norm: str) -> tuple[float, str]:
         target_len = max(1, len(a_norm))
         min_len = max(1, int(target_len * self.min_ratio_window))
         max_len_w = max(min_len, int(target_len * self.max_ratio_window))
@@ -32,10 +61,31 @@ class TextSimilarity:
 
         best = 0.0
         best_sub = ""
+        a_count = Counter(a_norm)
+        len_a = len(a_norm)
         step_len = max(1, target_len // self.coarse_step_divisor)
         for L in range(min_len, max_len_w + 1, step_len):
             step = max(1, L // self.fine_step_divisor)
+            # 窓内の文字数と a との共通文字数をスライドしながら更新し、
+            # 上限 2*共通/(len(a)+L) が best 以下の窓は SequenceMatcher を作らずに飛ばす（結果は総当たりと同じ）
+            w_count: Counter = Counter()
+            common = 0
+            lo = hi = 0
             for i in range(0, len(b_norm) - L + 1, step):
+                while lo < i:
+                    c = b_norm[lo]
+                    w_count[c] -= 1
+                    if w_count[c] < a_count[c]:
+                        common -= 1
+                    lo += 1
+                while hi < i + L:
+                    c = b_norm[hi]
+                    if w_count[c] < a_count[c]:
+                        common += 1
+                    w_count[c] += 1
+                    hi += 1
+                if 2.0 * common / (len_a + L) <= best:
+                    continue
                 sub = b_norm[i:i + L]
                 r = difflib.SequenceMatcher(None, a_norm, sub).ratio()
                 if r > best:
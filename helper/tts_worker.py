@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# experiment/ の Google STT 版で共有する読み上げ用ワーカー。応答ごとにスレッドを作らず使い回す
+# （新しい応答は前の応答の終了を待たずに始まるので2本）
+_tts_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="experiment_tts")
+
+
+class TTSWorkerMixin:
+    """
+    VoiceVoxTTS の読み上げを _tts_pool で非同期に回す。
+    使う側で tts, tts_lock, tts_fut, corr_gate, led/use_led, motor/use_motor,
+    halo_helper, your_name と履歴（history_turns, history_lock, history_max_*）を用意しておく。
+    """
+
+    # ---------- tts control ----------
+    def stop_tts(self) -> None:
+        try:
+            self.tts.stop()
+        except Exception:
+            pass
+
+    def _start_tts_thread(self, target) -> None:
+        # 進行中があれば停止（VoiceVoxTTS は呼び出しごとの停止フラグで古い方だけが抜けるので、終了を待たずに次を始める）
+        with self.tts_lock:
+            self.stop_tts()
+            self.tts_fut = _tts_pool.submit(target)
+
+    def speak_async(self, text: str) -> None:
+        def _run():
+            try:
+                self.tts.speak(text, self.led, self.use_led, self.motor, self.use_motor, corr_gate=self.corr_gate)
+            except Exception as e:
+                print(f"TTSエラー: {e}")
+
+        self._start_tts_thread(_run)
+
+    def speak_stream_async(self, llm_stream) -> None:
+        """LLMのストリームを1行目(メッセージ)だけ読み上げ、終わったら応答を履歴に追加する"""
+        def _run():
+            parts: list = []
+            try:
+                self.tts.stream_speak(self.halo_helper.iter_message_tokens(llm_stream, parts), None, corr_gate=self.corr_gate)
+            except Exception as e:
+                print(f"TTSエラー: {e}")
+            finally:
+                llm_stream.close()
+            response, _ = self.halo_helper.get_halo_response("".join(parts))
+            response = self.halo_helper.replace_dont_need_word(response, self.your_name)
+            if response:
+                with self.history_lock:
+                    self.halo_helper.append_history_turn(self.history_turns, self.your_name, response, self.history_max_tokens, self.history_max_turns)
+
+        self._start_tts_thread(_run)
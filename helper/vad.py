@@ -1,10 +1,38 @@
+import logging
 import sounddevice as sd
 import time
 import threading
-from typing import Optional
+from typing import Dict, Optional, TYPE_CHECKING
 import webrtcvad
 import numpy as np
 
+if TYPE_CHECKING:
+    from helper.vad_silero import SileroVAD
+
+logger = logging.getLogger("halo.vad")
+
+# webrtcvad.Vad は内部状態を持つので、スレッド・aggressiveness ごとに1つ作って使い回す
+_vad_local = threading.local()
+
+
+def _get_vad(aggressiveness: int) -> "webrtcvad.Vad":
+    instances: Dict[int, "webrtcvad.Vad"] = _vad_local.__dict__.setdefault("instances", {})
+    vad = instances.get(aggressiveness)
+    if vad is None:
+        vad = instances[aggressiveness] = webrtcvad.Vad(aggressiveness)
+    return vad
+
+
+def _get_silero(model_path: str, samplerate: int) -> "SileroVAD":
+    instances: Dict[tuple, "SileroVAD"] = _vad_local.__dict__.setdefault("silero", {})
+    key = (model_path, samplerate)
+    vad = instances.get(key)
+    if vad is None:
+        from helper.vad_silero import SileroVAD
+        vad = instances[key] = SileroVAD(model_path, samplerate)
+    return vad
+
+
 class VAD:
     @staticmethod
     def listen_until_voice_webrtc(
@@ -30,9 +58,9 @@ class VAD:
         if samplerate not in (8000, 16000, 32000, 48000):
             raise ValueError("samplerate must be one of 8000, 16000, 32000, 48000")
 
-        vad = webrtcvad.Vad(aggressiveness)
+        vad = _get_vad(aggressiveness)
         samples_per_frame = int(samplerate * frame_duration_ms / 1000)
-        start_time = time.time()
+        start_time = time.monotonic()
 
         try:
             with sd.InputStream(
@@ -49,11 +77,12 @@ class VAD:
                         return False
                     np_frames, _ = stream.read(samples_per_frame)
                     if np_frames.size == 0:
-                        if timeout_seconds is not None and (time.time() - start_time) >= timeout_seconds:
+                        if timeout_seconds is not None and (time.monotonic() - start_time) >= timeout_seconds:
                             return False
                         continue
 
-                    frame_i16 = np_frames.reshape(-1).astype(np.int16)
+                    # dtype="int16" で読んでいるので変換コピーは不要
+                    frame_i16 = np_frames.reshape(-1)
                     frame_bytes = frame_i16.tobytes()
                     try:
                         is_speech = vad.is_speech(frame_bytes, samplerate)
@@ -64,7 +93,7 @@ class VAD:
                         if corr_gate is not None:
                             try:
                                 if corr_gate.is_tts_like(frame_i16):
-                                    print("TTS由来の音声と判断して無視します。")
+                                    logger.debug("TTS由来の音声と判断して無視します。")
                                     consecutive_speech = 0
                                     continue
                             except Exception:
@@ -75,7 +104,76 @@ class VAD:
                     else:
                         consecutive_speech = 0
 
-                    if timeout_seconds is not None and (time.time() - start_time) >= timeout_seconds:
+                    if timeout_seconds is not None and (time.monotonic() - start_time) >= timeout_seconds:
+                        return False
+        except Exception:
+            return False
+
+    @staticmethod
+    def listen_until_voice_silero(
+        model_path: str,
+        samplerate: int = 16000,
+        device: Optional[str] = None,
+        timeout_seconds: Optional[float] = None,
+        min_speech_ms: int = 60,
+        threshold: float = 0.5,
+        corr_gate=None,
+        stop_event: Optional[threading.Event] = None,
+    ) -> bool:
+        """
+        Silero VAD(ONNX) で発話を検出したら True を返す。引数は listen_until_voice_webrtc に合わせている。
+        - samplerate: 8000/16000 のいずれか（窓は 16kHz で 512 サンプル = 32ms）
+        - min_speech_ms: 発話確率が threshold 以上の窓がこの時間ぶん連続したら検出とする
+        - timeout_seconds: タイムアウト（秒）。None なら無限待機
+        """
+        silero = _get_silero(model_path, samplerate)
+        silero.reset()
+        window = silero.window
+        window_ms = window * 1000 / samplerate
+        min_windows = max(1, int(-(-min_speech_ms // window_ms)))
+        start_time = time.monotonic()
+
+        try:
+            with sd.InputStream(
+                samplerate=samplerate,
+                channels=1,
+                dtype="int16",
+                blocksize=window,
+                device=device,
+            ) as stream:
+                consecutive_speech = 0
+                while True:
+                    if stop_event is not None and stop_event.is_set():
+                        print("vad thread stop event")
+                        return False
+                    np_frames, _ = stream.read(window)
+                    if np_frames.size == 0:
+                        if timeout_seconds is not None and (time.monotonic() - start_time) >= timeout_seconds:
+                            return False
+                        continue
+
+                    frame_i16 = np_frames.reshape(-1)
+                    try:
+                        is_speech = silero.speech_prob(frame_i16) >= threshold
+                    except Exception:
+                        is_speech = False
+
+                    if is_speech:
+                        if corr_gate is not None:
+                            try:
+                                if corr_gate.is_tts_like(frame_i16):
+                                    logger.debug("TTS由来の音声と判断して無視します。")
+                                    consecutive_speech = 0
+                                    continue
+                            except Exception:
+                                pass
+                        consecutive_speech += 1
+                        if consecutive_speech >= min_windows:
+                            return True
+                    else:
+                        consecutive_speech = 0
+
+                    if timeout_seconds is not None and (time.monotonic() - start_time) >= timeout_seconds:
                         return False
         except Exception:
             return False
@@ -102,7 +200,7 @@ class VAD:
             raise ValueError("samplerate must be one of 8000, 16000, 32000, 48000")
 
         samples_per_frame = int(samplerate * frame_duration_ms / 1000)
-        start_time = time.time()
+        start_time = time.monotonic()
 
         try:
             with sd.InputStream(
@@ -119,7 +217,7 @@ class VAD:
                         return False
                     np_frames, _ = stream.read(samples_per_frame)
                     if np_frames.size == 0:
-                        if timeout_seconds is not None and (time.time() - start_time) >= timeout_seconds:
+                        if timeout_seconds is not None and (time.monotonic() - start_time) >= timeout_seconds:
                             return False
                         continue
 
@@ -136,7 +234,7 @@ class VAD:
                     else:
                         consecutive_over = 0
 
-                    if timeout_seconds is not None and (time.time() - start_time) >= timeout_seconds:
+                    if timeout_seconds is not None and (time.monotonic() - start_time) >= timeout_seconds:
                         return False
         except Exception:
             return False
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+class SileroVAD:
+    """
+    Silero VAD（silero_vad.onnx, v5）を onnxruntime で動かし、窓ごとの発話確率を返す。
+    - 16kHz は 512 サンプル、8kHz は 256 サンプルの窓で推論する（直前の窓の末尾を文脈として前に付ける）
+    - 入力・状態の配列は使い回し、推論ごとに確保しない
+    """
+
+    def __init__(self, model_path: str, samplerate: int = 16000):
+        # onnxruntime は silero を選んだ時だけ読み込む
+        import onnxruntime as ort
+
+        if samplerate not in (8000, 16000):
+            raise ValueError("silero vad supports samplerate 8000 or 16000")
+        opts = ort.SessionOptions()
+        opts.inter_op_num_threads = 1
+        opts.intra_op_num_threads = 1
+        self._sess = ort.InferenceSession(model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.samplerate = samplerate
+        self.window = 512 if samplerate == 16000 else 256
+        self._context_size = 64 if samplerate == 16000 else 32
+        self._sr = np.array(samplerate, dtype=np.int64)
+        self._input = np.zeros((1, self._context_size + self.window), dtype=np.float32)
+        self._state = np.zeros((2, 1, 128), dtype=np.float32)
+
+    def reset(self) -> None:
+        """新しい音声ストリームを始める前に内部状態を消す"""
+        self._input.fill(0.0)
+        self._state.fill(0.0)
+
+    def speech_prob(self, frame_int16: np.ndarray) -> float:
+        """window サンプルの int16 フレームに対する発話確率（0..1）"""
+        x = self._input
+        c = self._context_size
+        x[0, :c] = x[0, -c:]
+        np.multiply(frame_int16, 1.0 / 32768.0, out=x[0, c:], casting="unsafe")
+        out, self._state = self._sess.run(None, {"input": x, "state": self._state, "sr": self._sr})
+        return float(out[0, 0])
@@ -208,10 +208,12 @@ class WavPlayer:
         rate: int = entry['rate']
         num_frames: int = entry['num_frames']
 
+        # スライスでコピーが発生しないよう memoryview で切り出す
+        view = memoryview(data)
         if start_frame > 0 and start_frame < num_frames:
             frame_size = channels * sample_width
             start_byte = start_frame * frame_size
-            data = data[start_byte:]
+            view = view[start_byte:]
 
         self._ensure_output_format(channels=channels, sample_width=sample_width, rate=rate)
 
@@ -220,11 +222,11 @@ class WavPlayer:
                 frame_size = channels * sample_width
                 chunk_bytes = self._frames_per_buffer * frame_size
                 pos = 0
-                n = len(data)
+                n = len(view)
                 while not self._stop_event.is_set() and pos < n:
                     end = min(pos + chunk_bytes, n)
                     try:
-                        self._stream.write(data[pos:end])
+                        self._stream.write(view[pos:end])
                     except Exception:
                         break
                     pos = end
@@ -296,7 +298,23 @@ class WavPlayer:
                 key = base
             listKeys.append(key)
 
-        return self.preload(listPaths, list_keys=listKeys)
+        results = self.preload(listPaths, list_keys=listKeys)
+        self.warm_up()
+        return results
+
+    def warm_up(self) -> None:
+        """
+        事前読み込み済みWAVのフォーマットで出力ストリームを先に開いておく。
+        初回の random_play(割り込みボイス/フィラー) でデバイスを開く待ちが発生しないようにする。
+        """
+        if self._stream is not None or not self._list_keys:
+            return
+        entry = self._preloaded[self._list_keys[0]]
+        try:
+            self._open_stream(channels=entry['channels'], sample_width=entry['sample_width'], rate=entry['rate'])
+            self._stream.stop_stream()
+        except Exception as e:
+            print(f"出力ストリームのウォームアップに失敗: {e}")
 
     # ---- internals ----
     def _ensure_pyaudio(self):
@@ -1,22 +1,44 @@
 # pip install --upgrade openai
 from openai import OpenAI
+import hashlib
 import time
 
 class LLM:
     def __init__(self):
         self.client = OpenAI()
+        # システムプロンプトは毎ターン同一バイト列で先頭に置き、プロバイダ側のプレフィックスキャッシュを効かせる
+        # 本番・要約・ウォームアップが別スレッドから違うプロンプトで呼ぶので、プロンプトごとに (メッセージ, キャッシュキー) を持つ
+        self._system_cache: dict = {}
+        self.system_cache_size = 8
+
+    def _build_messages(self, prompt, system_content, assistant_content):
+        """(messages, prompt_cache_key) を返す"""
+        cached = self._system_cache.get(system_content)
+        if cached is None:
+            cached = (
+                {"role": "system", "content": system_content},
+                hashlib.sha256(system_content.encode("utf-8")).hexdigest()[:32],
+            )
+            if len(self._system_cache) >= self.system_cache_size:
+                self._system_cache.clear()
+            self._system_cache[system_content] = cached
+        system_message, cache_key = cached
+        messages = [
+            system_message,
+            {"role": "assistant", "content": assistant_content},
+            {"role": "user", "content": prompt},
+        ]
+        return messages, cache_key
 
     def generate_text(self, default_model, prompt, system_content, assistant_content):
+        messages, cache_key = self._build_messages(prompt, system_content, assistant_content)
         start_time = time.perf_counter()
         resp = self.client.chat.completions.create(
             model=default_model,
             # model="gpt-4o-mini",
             # model="gpt-4.1-nano",
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "assistant", "content": assistant_content},
-                {"role": "user", "content": prompt},
-            ]
+            messages=messages,
+            extra_body={"prompt_cache_key": cache_key},
         )
         end_time = time.perf_counter()
         print(f"[LLM latency] {end_time - start_time:.1f} s")
@@ -26,13 +48,11 @@ class LLM:
         """
         4o-mini の出力をストリーミングで1トークン(または断片)ずつ yield する。
         """
+        messages, cache_key = self._build_messages(prompt, system_content, assistant_content)
         resp = self.client.chat.completions.create(
             model=default_model,
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "assistant", "content": assistant_content},
-                {"role": "user", "content": prompt},
-            ],
+            messages=messages,
+            extra_body={"prompt_cache_key": cache_key},
             stream=True,
             stream_options={"include_usage": False},
         )
@@ -40,4 +60,3 @@ class LLM:
             delta = chunk.choices[0].delta.content
             if delta:
                 yield delta
-
@@ -7,12 +7,13 @@ class RandomAction:
         self.config = config
 
     def reset_timer(self):
-        self.start_timer = time.time()
+        self.start_timer = time.monotonic()
         print("reset_timer")
 
     def random_action(self, random_action_time: float):
-        print(time.time() - self.start_timer)
-        if time.time() - self.start_timer > random_action_time:
+        elapsed = time.monotonic() - self.start_timer
+        print(elapsed)
+        if elapsed > random_action_time:
             print("random_action")
             if self.config["motor"]["use_motor"]:
                 self.motor_controller.motor_pan_kyoro_kyoro(3, 2)
@@ -1,9 +1,12 @@
 import os
 import threading
+from contextlib import suppress
 from typing import Optional, Callable
 import azure.cognitiveservices.speech as speechsdk
 from motor_controller import MotorController
 
+_SUPPRESS = suppress(Exception)
+
 class AzureSpeechToText:
     def __init__(self, language: str = "ja-JP", subscription: Optional[str] = None,
                  region: Optional[str] = None, device_id: Optional[str] = None):
@@ -114,15 +117,16 @@ class AzureSpeechToText:
                 self.recognizer.stop_continuous_recognition_async().get()
             except Exception:
                 pass
-            # ハンドラを外しておく（重複防止）
-            try:
-                self.recognizer.recognizing.disconnect_all()
-                self.recognizer.recognized.disconnect_all()
-                self.recognizer.canceled.disconnect_all()
-                self.recognizer.session_started.disconnect_all()
-                self.recognizer.session_stopped.disconnect_all()
-            except Exception:
-                pass
+            # ハンドラを外しておく（重複防止）。1つ失敗しても残りは解除する
+            for sig in (
+                self.recognizer.recognizing,
+                self.recognizer.recognized,
+                self.recognizer.canceled,
+                self.recognizer.session_started,
+                self.recognizer.session_stopped,
+            ):
+                with _SUPPRESS:
+                    sig.disconnect_all()
 
     # 既存APIを残したい場合は中で fast を呼ぶ
     def listen_once(self, timeout_sec: float = 15.0) -> str:
@@ -0,0 +1,48 @@
+import threading
+from collections import deque
+
+import pytest
+
+halo = pytest.importorskip("halo")
+from helper.halo_helper import HaloHelper
+
+
+def _make_halo():
+    """ハードウェアを触らないよう __init__ を通さずに、履歴まわりだけを持つ Halo を作る"""
+    h = halo.Halo.__new__(halo.Halo)
+    h.halo_helper = HaloHelper()
+    h.history_turns = deque()
+    h.history_lock = threading.Lock()
+    h._history_summary = ""
+    h.history_max_tokens = 2000
+    h.history_max_turns = 16
+    h.summarize_history = lambda evicted: None
+    return h
+
+
+def test_add_history_from_other_thread_while_rendering():
+    h = _make_halo()
+    done = threading.Event()
+    errors = []
+
+    def writer():
+        try:
+            for i in range(5000):
+                h.add_history("ハロ", f"応答{i}")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    t = threading.Thread(target=writer)
+    t.start()
+    try:
+        while not done.is_set():
+            h.render_history()
+    except RuntimeError as e:
+        errors.append(e)
+    t.join()
+
+    assert errors == []
+    assert 0 < len(h.history_turns) <= h.history_max_turns
+    assert h.render_history().endswith("ハロ: 応答4999\n")
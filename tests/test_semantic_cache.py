@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("numpy")
+from helper.semantic_cache import SemanticCache
+
+
+def test_hit_returns_response_only():
+    cache = SemanticCache()
+    cache.put("今日の天気は？", "晴れだよ", "")
+    assert cache.get("今日の天気は？") == "晴れだよ"
+
+
+def test_response_with_command_is_not_cached():
+    cache = SemanticCache()
+    cache.put("超魔界村について調べて", "調べるね", "web_search 超魔界村")
+    assert cache.get("超魔界村について調べて") is None
+
+
+def test_context_must_match():
+    cache = SemanticCache()
+    cache.put("うん", "よかった", "", context="元気？")
+    assert cache.get("うん", context="元気？") == "よかった"
+    assert cache.get("うん", context="眠い？") is None
+
+
+def test_expired_rows_are_skipped():
+    cache = SemanticCache(ttl_sec=-1.0)
+    cache.put("今何時？", "10時だよ", "")
+    assert cache.get("今何時？") is None
@@ -1,12 +1,26 @@
 # halo.py
 import json
+import re
 import time
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from llm_stream import openai_token_stream
 from voicevox import VoiceVoxTTS  # ← 追加：クラスをインポート
 from wav_player import WavPlayer
 from stt_azure import AzureSpeechToText
 
+# LLMへのリクエスト送信〜最初の断片待ち用（フィラー再生と並行させる）
+_llm_pool = ThreadPoolExecutor(max_workers=1)
+
+
+def open_token_stream(user_text: str, system_content: str, history: str):
+    """リクエストを送って最初の断片まで読み、(最初の断片, 残りのストリーム) を返す"""
+    stream = openai_token_stream(user_text, system_content, history)
+    return next(stream, ""), stream
+
+
 def load_config(config_path: str = "config.json") -> dict:
     """設定ファイル（config.json）を読み込む"""
     try:
@@ -73,7 +87,8 @@ def main():
 
     system_content = replace_placeholders(system_content, owner_name, your_name)
     print(system_content)
-    history = ""
+    # 直近 history_max_turns 発話だけ保持し、LLM呼び出し時に1回だけ文字列にする
+    history_turns = deque(maxlen=int(config.get("history_max_turns", 16)))
 
     try:
         loop_count = 0
@@ -96,7 +111,7 @@ def main():
             
             user_text = apply_text_changes(user_text, change_name)
             owner_text = f"{owner_name}: {user_text}"
-            history += owner_text + "\n"
+            history_turns.append(owner_text)
             print(owner_text)
             stt_end_time = time.perf_counter()
 
@@ -109,18 +124,22 @@ def main():
                     print(f"TTSでエラーが発生しました: {e}")
                 break
             
+            # LLMへのリクエストはフィラー再生より先に投げておく
+            print("LLMで応答を生成中...")
+            history = "".join(f"{t}\n" for t in history_turns)
+            llm_fut = _llm_pool.submit(open_token_stream, user_text, system_content, history)
+
             if isfiller:
                 player.random_play(block=False)
                 print("filler再生中")
 
-            print("LLMで応答を生成中...")
             try:
-                response = openai_token_stream(user_text, system_content, history)
-                tts.stream_speak(response)
+                first, response = llm_fut.result()
+                tts.stream_speak(chain((first,), response), None)
                 '''
                 response = response.replace(f"{your_name}:", "")
                 your_text = f"{your_name}: {response}"
-                history += your_text + "\n"
+                history_turns.append(your_text)
                 print(your_text)
                 '''
             except Exception as e:
@@ -158,10 +177,11 @@ def exec_stt(stt: AzureSpeechToText) -> str:
         print("\n音声認識を中断しました。")
         raise  # メインループに中断を伝える
 
+# 終了コマンドとみなす語（1回の走査で判定する）
+_FAREWELL_RE = re.compile("終了|バイバイ|さようなら")
+
 def check_end_command(user_text: str) -> bool:
-    if "終了" in user_text or "バイバイ" in user_text or "さようなら" in user_text:
-        return True
-    return False
+    return _FAREWELL_RE.search(user_text) is not None
 
 def exec_tts(tts: VoiceVoxTTS, text: str):
     try:
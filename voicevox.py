@@ -3,6 +3,8 @@ import re
 import queue
 import threading
 import time
+from collections import OrderedDict
+from contextlib import suppress
 from io import BytesIO
 from typing import Dict, Optional, TYPE_CHECKING
 
@@ -11,6 +13,9 @@ import requests
 import simpleaudio as sa
 
 
+# 例外を握りつぶす共通のコンテキストマネージャ（suppress は再入可能なので使い回す）
+_SUPPRESS = suppress(Exception)
+
 
 class VoiceVoxTTS:
     """
@@ -21,6 +26,7 @@ class VoiceVoxTTS:
     """
 
     _SENT_SPLIT = re.compile(r"(.*?[。！？\?\!]|[^。！？\?\!]+$)")
+    _COMMA = re.compile(r"[、，]")
 
     def __init__(
         self,
@@ -31,11 +37,16 @@ class VoiceVoxTTS:
         request_timeout_query: int = 15,
         request_timeout_synth: int = 60,
         default_params: Optional[Dict] = None,
+        first_chunk_max_len: int = 20,
+        first_chunk_min_len: int = 8,
     ):
         self.base_url = base_url
         self.speaker = speaker
         self.max_len = max_len
         self.queue_size = queue_size
+        # 最初の文が長い時は読点で先に切り出し、合成待ち（最初の音が出るまで）を短くする
+        self.first_chunk_max_len = first_chunk_max_len
+        self.first_chunk_min_len = first_chunk_min_len
         self.request_timeout_query = request_timeout_query
         self.request_timeout_synth = request_timeout_synth
 
@@ -52,10 +63,21 @@ class VoiceVoxTTS:
         if default_params:
             self.params.update(default_params)
 
-        # 実行時制御
+        # 実行時制御（speak/stream_speak の呼び出しごとに作り直し、stop() は実行中のものだけを止める）
         self._stop_event = threading.Event()
         self._play_obj: Optional[sa.PlayObject] = None
         self._is_speaking: bool = False
+        # 再生時に触るデバイス（speak/stream_speak の呼び出しごとに差し替わる）
+        self.motor_controller: Optional[MotorController] = None
+        self.filler = None
+        self.filler_tts = None
+
+        # audio_query / synthesis で同じ接続を使い回す（毎回のTCP接続を避ける）
+        self._http = requests.Session()
+        # 「起動した」「待機モード」など繰り返し読む定型文の合成結果（文, 話者, パラメータ → WAV）
+        self._wav_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self.wav_cache_size = 32
+        self._wav_cache_lock = threading.Lock()
 
     # --------- 公開API ---------
     def set_speaker(self, speaker: int):
@@ -70,13 +92,19 @@ class VoiceVoxTTS:
         motor_controller: MotorController, 
         corr_gate=None, 
         filler=None,
-        filler_tts=None):
+        filler_tts=None,
+        stop_event: Optional[threading.Event] = None):
         """
         同期実行：合成＆再生を行い、完了（または stop()）まで戻らない。
+        - stop_event は begin_utterance() で事前に確保したもの。ワーカーが speak() に着く前の stop() も取りこぼさない
         """
+        if stop_event is None:
+            # 前の呼び出しのスレッドが残っていても、そちらは自分の stop_event で止まる（join して待たない）
+            stop_event = self._stop_event = threading.Event()
+        elif stop_event.is_set():
+            return  # 開始前に止められた
         self.filler_tts = filler_tts
         self.motor_controller = motor_controller
-        self._stop_event.clear()
         self._is_speaking = True
         self.filler = filler
         start_time = time.perf_counter()
@@ -87,24 +115,30 @@ class VoiceVoxTTS:
         def producer():
             try:
                 for sent in chunks:
-                    if self._stop_event.is_set():
+                    if stop_event.is_set():
+                        break
+                    if not self._put_unless_stopped(q, ("log", f"gen:{sent}"), stop_event):
+                        break
+                    wav_bytes = self._synthesize(sent)
+                    if not self._put_unless_stopped(q, ("wav", wav_bytes), stop_event):
                         break
-                    q.put(("log", f"gen:{sent}"))
-                    query = self._audio_query(sent, self.speaker)
-                    # パラメータを上書き
-                    query.update(self.params)
-                    wav_bytes = self._synth(query, self.speaker)
-                    q.put(("wav", wav_bytes))
             finally:
-                q.put(STOP)
+                self._put_unless_stopped(q, STOP, stop_event)
 
         def consumer():
+            play_obj = None
             while True:
-                item = q.get()
+                # 合成待ちの間に止められても抜けられるよう、短い間隔で stop_event を見る
+                try:
+                    item = q.get(timeout=0.1)
+                except queue.Empty:
+                    if stop_event.is_set():
+                        break
+                    continue
                 if item is STOP:
                     break
                 tag, payload = item
-                if self._stop_event.is_set():
+                if stop_event.is_set():
                     break
                 if tag == "wav":
                     if corr_gate is not None:
@@ -114,10 +148,14 @@ class VoiceVoxTTS:
                         except Exception:
                             pass
                     self._play(payload)
+                    play_obj = self._play_obj
                     end_time = time.perf_counter()
                     print(f"[VoiceVox latency] {end_time - start_time:.1f} s")
-                    if self._play_obj:
-                        self._play_obj.wait_done()
+                    # 再生開始と stop() が行き違った場合もここで止める
+                    if stop_event.is_set():
+                        break
+                    if play_obj:
+                        play_obj.wait_done()
                     """
                     self._play(payload)
                     # 合成は並行で進むため、ここは再生終了まで待つ
@@ -125,11 +163,12 @@ class VoiceVoxTTS:
                         self._play_obj.wait_done()
                     """
 
-            # 停止時の後片付け
-            with self._suppress_ex():
-                if self._play_obj:
-                    self._play_obj.stop()
-                    self.motor_controller.led_stop_blink()  # LED点滅停止
+            # 停止時の後片付け（自分の再生だけを止める。次の呼び出しに切り替わっていればLEDは触らない）
+            with _SUPPRESS:
+                if play_obj:
+                    play_obj.stop()
+                    if self._stop_event is stop_event:
+                        self.motor_controller.led_stop_blink()  # LED点滅停止
                     print("音声再生終了")
             self._drain_queue(q)
 
@@ -138,15 +177,23 @@ class VoiceVoxTTS:
         try:
             t_p.start()
             t_c.start()
-            t_p.join()
+            # 待つのは再生側だけ。止めた後の producer は /synthesis の応答待ち（最大 timeout 秒）で残ることがあるが、
+            # daemon スレッドで自分の stop_event を見て抜けるので、ここで join して次の読み上げを待たせない
             t_c.join()
         finally:
-            self._is_speaking = False
+            if self._stop_event is stop_event:
+                self._is_speaking = False
+
+    def begin_utterance(self) -> threading.Event:
+        """進行中の読み上げを止め、次の speak() 用の stop_event を作って返す。"""
+        self.stop()
+        stop_event = self._stop_event = threading.Event()
+        return stop_event
 
     def stop(self):
         """進行中の合成・再生を停止（割込み）。"""
         self._stop_event.set()
-        with self._suppress_ex():
+        with _SUPPRESS:
             if self._play_obj:
                 self._play_obj.stop()
 
@@ -182,10 +229,37 @@ class VoiceVoxTTS:
                         buf += p
                 if buf:
                     out.append(buf)
+        if out and len(out[0]) > self.first_chunk_max_len:
+            m = self._COMMA.search(out[0], self.first_chunk_min_len - 1)
+            if m and m.end() < len(out[0]):
+                out[0:1] = [out[0][:m.end()], out[0][m.end():]]
         return out
 
+    def warm_up(self):
+        """エンジンへの接続を先に張っておき、最初の発話で接続待ちが出ないようにする"""
+        r = self._http.get(f"{self.base_url}/version", timeout=self.request_timeout_query)
+        r.raise_for_status()
+
+    def _synthesize(self, sent: str) -> bytes:
+        """1文を合成してWAVを返す。同じ文・話者・パラメータなら前回の結果を使う"""
+        key = (sent, self.speaker, tuple(sorted(self.params.items())))
+        with self._wav_cache_lock:
+            wav_bytes = self._wav_cache.get(key)
+            if wav_bytes is not None:
+                self._wav_cache.move_to_end(key)
+                return wav_bytes
+        query = self._audio_query(sent, self.speaker)
+        # パラメータを上書き
+        query.update(self.params)
+        wav_bytes = self._synth(query, self.speaker)
+        with self._wav_cache_lock:
+            self._wav_cache[key] = wav_bytes
+            while len(self._wav_cache) > self.wav_cache_size:
+                self._wav_cache.popitem(last=False)
+        return wav_bytes
+
     def _audio_query(self, text: str, speaker: int) -> Dict:
-        r = requests.post(
+        r = self._http.post(
             f"{self.base_url}/audio_query",
             params={"text": text, "speaker": speaker},
             timeout=self.request_timeout_query,
@@ -194,7 +268,7 @@ class VoiceVoxTTS:
         return r.json()
 
     def _synth(self, query: Dict, speaker: int) -> bytes:
-        r = requests.post(
+        r = self._http.post(
             f"{self.base_url}/synthesis",
             params={"speaker": speaker},
             json=query,
@@ -211,8 +285,9 @@ class VoiceVoxTTS:
         if self.filler_tts is not None:
             if self.filler_tts.is_playing():
                 self.filler_tts.stop()
-        self.motor_controller.led_start_blink()
-        self.motor_controller.motor_tilt_kyoro_kyoro(2)
+        if self.motor_controller is not None:
+            self.motor_controller.led_start_blink()
+            self.motor_controller.motor_tilt_kyoro_kyoro(2)
         self._play_obj = wav.play()
     
     def _wav_to_int16_mono16k(self, wav_bytes: bytes):
@@ -232,29 +307,34 @@ class VoiceVoxTTS:
             pcm = np.interp(x_new, x_old, pcm.astype(np.float32)).astype(np.int16)
         return pcm
 
+    @staticmethod
+    def _put_unless_stopped(q: "queue.Queue", item, stop_event: threading.Event) -> bool:
+        """キューが空くまで待って積む。先に stop_event が立ったら積まずに False を返す"""
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if stop_event.is_set():
+                    return False
+
     @staticmethod
     def _drain_queue(q: "queue.Queue"):
-        with VoiceVoxTTS._suppress_ex():
+        with _SUPPRESS:
             while not q.empty():
                 q.get_nowait()
-
-    @staticmethod
-    def _suppress_ex():
-        class _Ctx:
-            def __enter__(self):  # noqa: D401
-                return self
-            def __exit__(self, exc_type, exc, tb):
-                return True  # すべて無視
-        return _Ctx()
     
-    _SENT_END = re.compile(r"[。．！？!?]\s*$")  # 文末検出（日本語/記号）
+    _SENT_END_CHARS = frozenset("。．！？!?")  # 文末検出（末尾1文字だけを見る）
 
     def stream_speak(self, token_iter, motor_controller: MotorController, corr_gate=None):
         """
         ストリーミング入力（文字列断片のイテレータ）を文単位にまとめて
         でき次第 VOICEVOX で合成→即時再生する。stop() で中断可。
         """
-        self._stop_event.clear()
+        self.motor_controller = motor_controller
+        self.filler = None
+        self.filler_tts = None
+        stop_event = self._stop_event = threading.Event()
         start_time = time.perf_counter()
         q: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
         STOP = object()
@@ -263,11 +343,11 @@ class VoiceVoxTTS:
             buf = ""
             try:
                 for token in token_iter:
-                    if self._stop_event.is_set():
+                    if stop_event.is_set():
                         break
                     buf += token
                     # 文末 or 長すぎ対策でフラッシュ
-                    if self._SENT_END.search(buf) or len(buf) >= self.max_len:
+                    if buf.rstrip()[-1:] in self._SENT_END_CHARS or len(buf) >= self.max_len:
                         s = buf.strip()
                         if s:
                             q.put(("text", s))
@@ -282,18 +362,17 @@ class VoiceVoxTTS:
                 q.put(STOP)
 
         def consumer():
+            play_obj = None
             while True:
                 item = q.get()
                 if item is STOP:
                     break
                 tag, sent = item
-                if self._stop_event.is_set():
+                if stop_event.is_set():
                     break
                 if tag == "text":
                     # 合成 → 再生（既存の内部関数を流用）
-                    query = self._audio_query(sent, self.speaker)
-                    query.update(self.params)
-                    wav_bytes = self._synth(query, self.speaker)
+                    wav_bytes = self._synthesize(sent)
                     # 相関ゲート用にfar-endへPCMを供給
                     if corr_gate is not None:
                         try:
@@ -301,16 +380,21 @@ class VoiceVoxTTS:
                             corr_gate.publish_farend(pcm)
                         except Exception:
                             pass
+                    if stop_event.is_set():
+                        break
                     self._play(wav_bytes)
+                    play_obj = self._play_obj
                     end_time = time.perf_counter()
                     print(f"[VoiceVox latency] {end_time - start_time:.1f} s")
-                    if self._play_obj:
-                        self._play_obj.wait_done()
+                    if stop_event.is_set():
+                        break
+                    if play_obj:
+                        play_obj.wait_done()
 
             # 後片付け
-            with self._suppress_ex():
-                if self._play_obj:
-                    self._play_obj.stop()
+            with _SUPPRESS:
+                if play_obj:
+                    play_obj.stop()
             self._drain_queue(q)
 
         t_p = threading.Thread(target=producer, daemon=True)
@@ -320,9 +404,7 @@ class VoiceVoxTTS:
 
     # （任意）単一文を即読みするヘルパーが欲しければこれも：
     def speak_sentence(self, sent: str):
-        query = self._audio_query(sent, self.speaker)
-        query.update(self.params)
-        wav_bytes = self._synth(query, self.speaker)
+        wav_bytes = self._synthesize(sent)
         self._play(wav_bytes)
         if self._play_obj:
             self._play_obj.wait_done()
@@ -1,16 +1,17 @@
 # tts_pipelined_bargein_gate_flush_skip.py
 import wave
-import re
 import queue
 import threading
 import time
+from contextlib import suppress
 from io import BytesIO
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
 
 import requests
 import simpleaudio as sa
 
 from helper.filler import Filler
+from helper.realtime import realtime_thread
 
 # 実機では本物の MotorController を使ってください
 try:
@@ -22,6 +23,9 @@ except Exception:
         def motor_tilt_kyoro_kyoro(self, n:int=1): pass
 
 
+_SUPPRESS = suppress(Exception)
+
+
 class VoiceVoxTTSPipelined:
     """
     VOICEVOX 常駐ストリームTTS
@@ -33,7 +37,9 @@ class VoiceVoxTTSPipelined:
       - skip_current(): 今の文だけ中断して次の文へ（軽量スキップ）
     """
 
-    _SENT_END = re.compile(r"[、。．！？!?]\s*$")  # 文末検出
+    # 文末判定はトークンごとに走るので、バッファ全体を正規表現で走査せず末尾1文字を集合で引く
+    _SENT_END_CHARS = frozenset("。．！？!?")  # 文末検出
+    _SOFT_END_CHARS = frozenset("、，")        # 読点（ある程度の長さがある時だけ区切る）
 
     def __init__(
         self,
@@ -41,6 +47,7 @@ class VoiceVoxTTSPipelined:
         speaker: int = 89,
         max_len: int = 80,
         queue_size_sent: int = 32,    # 文キューのサイズ
+        soft_min_len: int = 8,        # 読点で区切る最小文字数（短すぎる断片で合成往復を増やさない）
         request_timeout_query: int = 15,
         request_timeout_synth: int = 60,
         default_params: Optional[Dict] = None,
@@ -50,6 +57,7 @@ class VoiceVoxTTSPipelined:
         self.speaker = speaker
         self.max_len = max_len
         self.queue_size_sent = queue_size_sent
+        self.soft_min_len = soft_min_len
         self.request_timeout_query = request_timeout_query
         self.request_timeout_synth = request_timeout_synth
 
@@ -72,6 +80,8 @@ class VoiceVoxTTSPipelined:
 
         # 再生
         self._play_obj: Optional[sa.PlayObject] = None
+        # 再生開始ごとに呼ばれるフック（レイテンシ計測用）
+        self.on_play_start: Optional[Callable[[], None]] = None
 
         # 制御フラグ
         self._stop_event = threading.Event()     # 即停止（緊急）
@@ -136,6 +146,8 @@ class VoiceVoxTTSPipelined:
         filler=None,
         synth_workers: int = 2,
         autoplay: bool = True,
+        cpu_core: int = -1,
+        rt_priority: int = 0,
     ):
         with self._state_lock:
             if self._started:
@@ -148,6 +160,9 @@ class VoiceVoxTTSPipelined:
             self._motor = motor_controller
             self._corr_gate = corr_gate
             self._filler = filler
+            # プレーヤスレッドだけを固定コア・SCHED_FIFO で動かす（-1 / 0 なら変更しない）
+            self._player_cpu_core = cpu_core
+            self._player_rt_priority = rt_priority
 
             if autoplay:
                 self._play_gate.set()
@@ -197,10 +212,21 @@ class VoiceVoxTTSPipelined:
         - 再生ゲートが閉じている場合は、“次に再生予定”の文を飛ばして待機する
         """
         self._skip_event.set()
-        with self._suppress_ex():
+        with _SUPPRESS:
             if self._play_obj:
                 self._play_obj.stop()  # 再生中なら即停止 → 次ループで次文へ
 
+    def flush_ingest(self):
+        """
+        句点待ちの途中断片をすぐ文として流す（LLMのメッセージ行が終わった時などに呼ぶ）。
+        ingest スレッドは入力待ちで寝ているため、空文字を入れて起こす。
+        """
+        if not self._started:
+            return
+        self._force_ingest_flush = True
+        with _SUPPRESS:
+            self._in_q.put_nowait("")
+
     def push_text(self, text: str):
         if not text:
             return
@@ -221,7 +247,7 @@ class VoiceVoxTTSPipelined:
     def stop(self):
         """即時停止（すべて中断・破棄）"""
         self._stop_event.set()
-        with self._suppress_ex():
+        with _SUPPRESS:
             if self._play_obj:
                 self._play_obj.stop()
         self._drain_queue(self._in_q)
@@ -265,7 +291,7 @@ class VoiceVoxTTSPipelined:
 
     def stop_play_object(self):
         """再生オブジェクトを停止"""
-        with self._suppress_ex():
+        with _SUPPRESS:
             if self._play_obj:
                 self._play_obj.stop()
 
@@ -296,7 +322,7 @@ class VoiceVoxTTSPipelined:
 
         if mode == "hard":
             # 再生も即停止
-            with self._suppress_ex():
+            with _SUPPRESS:
                 if self._play_obj:
                     self._play_obj.stop()
 
@@ -379,7 +405,9 @@ class VoiceVoxTTSPipelined:
                     continue
 
                 buf += piece
-                if len(buf) >= self.max_len or self._SENT_END.search(buf):
+                last = buf.rstrip()[-1:]
+                if (len(buf) >= self.max_len or last in self._SENT_END_CHARS
+                        or (len(buf) >= self.soft_min_len and last in self._SOFT_END_CHARS)):
                     s = buf.strip()
                     if s:
                         epoch = self._epoch
@@ -394,7 +422,7 @@ class VoiceVoxTTSPipelined:
         # 最終フラッシュ（保険）
         tail = buf.strip()
         if tail:
-            with self._suppress_ex():
+            with _SUPPRESS:
                 epoch = self._epoch
                 seq = self._seq_counter; self._seq_counter += 1
                 self._sent_q.put((epoch, seq, tail))
@@ -422,7 +450,7 @@ class VoiceVoxTTSPipelined:
 
                     # AEC等：far-endへ16k/monoで供給（任意）
                     if self._corr_gate is not None:
-                        with self._suppress_ex():
+                        with _SUPPRESS:
                             pcm = self._wav_to_int16_mono16k(wav_bytes)
                             self._corr_gate.publish_farend(pcm)
 
@@ -443,6 +471,10 @@ class VoiceVoxTTSPipelined:
                     break
 
     def _run_player(self):
+        with realtime_thread(self._player_cpu_core, self._player_rt_priority):
+            self._player_loop()
+
+    def _player_loop(self):
         start_time = time.perf_counter()
         try:
             while not self._stop_event.is_set():
@@ -491,7 +523,8 @@ class VoiceVoxTTSPipelined:
                         self._skip_event.clear()
                         skipped_before_play = True
                         break
-                    time.sleep(0.02)
+                    # talk_resume() で開いたら即座に抜ける（stop/skip は 20ms ごとに確認）
+                    self._play_gate.wait(0.02)
                 if self._stop_event.is_set():
                     return
                 if skipped_before_play:
@@ -540,7 +573,7 @@ class VoiceVoxTTSPipelined:
                     self._pause_when_idle = False
 
         finally:
-            with self._suppress_ex():
+            with _SUPPRESS:
                 if self._play_obj:
                     self._play_obj.stop()
                 if self._motor:
@@ -583,13 +616,16 @@ class VoiceVoxTTSPipelined:
         with wave.open(BytesIO(wav_bytes), "rb") as wf:
             wav = sa.WaveObject.from_wave_read(wf)
         if self._filler is not None:
-            with self._suppress_ex():
+            with _SUPPRESS:
                 self._filler.stop_filler()
         if self._motor:
-            with self._suppress_ex():
+            with _SUPPRESS:
                 self._motor.led_start_blink()
                 self._motor.motor_tilt_kyoro_kyoro(2)
         self._play_obj = wav.play()
+        if self.on_play_start is not None:
+            with _SUPPRESS:
+                self.on_play_start()
 
     # ---------- utils ----------
     def _push_sentence_immediate(self, text: str):
@@ -628,20 +664,13 @@ class VoiceVoxTTSPipelined:
 
     @staticmethod
     def _drain_queue(q: "queue.Queue"):
-        with VoiceVoxTTSPipelined._suppress_ex():
+        with _SUPPRESS:
             while not q.empty():
                 try:
                     q.get_nowait()
                 except Exception:
                     break
 
-    @staticmethod
-    def _suppress_ex():
-        class _Ctx:
-            def __enter__(self): return self
-            def __exit__(self, exc_type, exc, tb): return True
-        return _Ctx()
-
 
 # ---- 使い方サンプル ----
 if __name__ == "__main__":